@@ -13,17 +13,22 @@ Options:
     --accepted-only   Only apply changes marked as 'accepted'
     --rejected-only   Only apply changes marked as 'rejected' (for comparison)
     --original        Don't apply any changes, rebuild original
+    --compress-level  Deflate level 0-9 for text entries (default: 3)
     --verbose, -v     Verbose output
 """
 
 import argparse
 import functools
+import hashlib
+import itertools
+import mmap
 import os
 import re
+import shutil
 import sys
 import zipfile
-import tempfile
-import shutil
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field
 from typing import Optional
 from html import escape as html_escape
@@ -31,8 +36,116 @@ from html import escape as html_escape
 # Force unbuffered output for real-time logging
 print = functools.partial(print, flush=True)
 
+# Change statuses that get applied in each output mode
+APPLY_STATUSES = {
+    'all': frozenset({'pending', 'accepted'}),
+    'accepted': frozenset({'accepted'}),
+    'none': frozenset(),
+}
 
-@dataclass
+# Header / chapter metadata patterns
+HEADER_RE = re.compile(rb'#BOOKWASH.*?(?=#SECTION:|#CHAPTER:|\Z)', re.DOTALL)
+TITLE_RE = re.compile(r'#TITLE:\s*(.+)')
+AUTHOR_RE = re.compile(r'#AUTHOR:\s*(.+)')
+LANGUAGE_RE = re.compile(r'#LANGUAGE:\s*(.+)')
+SOURCE_RE = re.compile(r'#SOURCE:\s*(.+)')
+ASSETS_RE = re.compile(r'#ASSETS:\s*(.+)')
+COVER_RE = re.compile(r'#IMAGE:\s*(.+)')
+FILE_RE = re.compile(r'#FILE:\s*(.+)')
+RATING_RE = re.compile(r'#RATING:\s*(.+)')
+NEEDS_CLEANING_RE = re.compile(r'#NEEDS_CLEANING:\s*(.+)')
+
+# Chapter boundaries - #SECTION: (new) and #CHAPTER: (legacy).
+# These run over the raw (memory-mapped) file bytes.
+SECTION_RE = re.compile(rb'#SECTION:\s*(.+?)\s*\n')
+CHAPTER_RE = re.compile(rb'#CHAPTER:\s*(\d+)\s*\n')
+
+# A #CHANGE: block: the id line, then body lines up to a line that is just
+# #END. A block missing its #END runs to the next #CHANGE: line or the end of
+# the chapter; its last line is captured as 'tail' if it has no newline.
+# (The line-start check is a lookbehind so the scan can skip ahead on the
+# '#CHANGE:' literal; a leading ^ would test every position.)
+CHANGE_BLOCK_RE = re.compile(
+    r'#CHANGE:(?<=^#CHANGE:)(?P<id>.*)\n'
+    r'(?P<body>(?:(?!#CHANGE:).*\n)*?)'
+    r'(?:[^\S\n]*(?P<end>#END)[^\S\n]*(?:\n|\Z)|(?=#CHANGE:)|(?P<tail>.*)\Z)',
+    re.MULTILINE
+)
+
+# Any bookwash metadata tag: #UPPERCASE_TAG: or #UPPERCASE_TAG
+METADATA_LINE_RE = re.compile(r'^#[A-Z][A-Z0-9_]*:?')
+
+# Bookwash format markers and their HTML equivalents
+FORMAT_MARKERS = {
+    '[H1]': '<h1>', '[/H1]': '</h1>',
+    '[H2]': '<h2>', '[/H2]': '</h2>',
+    '[H3]': '<h3>', '[/H3]': '</h3>',
+    '[H4]': '<h4>', '[/H4]': '</h4>',
+    '[H5]': '<h5>', '[/H5]': '</h5>',
+    '[H6]': '<h6>', '[/H6]': '</h6>',
+    '[B]': '<strong>', '[/B]': '</strong>',
+    '[I]': '<em>', '[/I]': '</em>',
+    '[U]': '<u>', '[/U]': '</u>',
+    '[BLOCKQUOTE]': '<blockquote>', '[/BLOCKQUOTE]': '</blockquote>',
+}
+FORMAT_MARKER_RE = re.compile('|'.join(re.escape(marker) for marker in FORMAT_MARKERS))
+
+# Runs of more than one blank line (spelled out rather than \n{3,} so the
+# regex engine can search for the literal prefix)
+BLANK_LINES_RE = re.compile(r'\n\n\n+')
+
+# [H1]..[H6] / [/H1]..[/H6] heading markers
+HEADING_MARKER_RE = re.compile(r'\[/?H[1-6]\]')
+
+# [IMG: filename] markers
+IMG_RE = re.compile(r'\[IMG:\s*([^\]]+)\]')
+
+# Synthetic section labels like "[Section 2]"
+SECTION_LABEL_RE = re.compile(r'^\[Section \d+\]$')
+
+# Characters not allowed in manifest ids
+NON_ID_CHAR_RE = re.compile(r'[^a-zA-Z0-9]')
+
+# Chapter XHTML boilerplate up to and including <body>; {title} must be escaped
+XHTML_HEAD_TEMPLATE = '''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+<head>
+  <title>{title}</title>
+  <meta charset="UTF-8"/>
+  <style type="text/css">
+    body {{ font-family: Georgia, serif; margin: 2em; line-height: 1.6; }}
+    h1, h2, h3, h4, h5, h6 {{ text-align: center; margin-top: 1.5em; margin-bottom: 1em; }}
+    p {{ text-indent: 1.5em; margin: 0.5em 0; }}
+    p.first {{ text-indent: 0; }}
+    p.image {{ text-indent: 0; text-align: center; margin: 1em 0; }}
+    img {{ max-width: 100%; height: auto; }}
+    blockquote {{ margin: 1em 2em; font-style: italic; }}
+  </style>
+</head>
+<body>'''
+XHTML_TAIL = '</body>\n</html>'
+
+# Deflate level for XHTML/OPF entries. Text compresses nearly as well at 3
+# as at zlib's default 6, for much less CPU.
+DEFAULT_COMPRESS_LEVEL = 3
+
+# Read buffer for streaming binary images into the EPUB
+IMAGE_COPY_BUFFER_SIZE = 1024 * 1024
+
+# Render chapters in a process pool only for books at least this long;
+# below it, worker startup costs more than it saves
+PARALLEL_RENDER_MIN_CHAPTERS = 8
+# Chapters handed to a worker per round trip
+PARALLEL_RENDER_CHUNKSIZE = 4
+
+
+# Parsed books hold one Change per change block, so drop the per-instance
+# __dict__ where dataclass slots are available (Python 3.10+).
+DATACLASS_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**DATACLASS_SLOTS)
 class Change:
     """Represents a single change block."""
     id: str
@@ -40,9 +153,12 @@ class Change:
     reason: str
     original: str
     cleaned: str
+    # Line-by-line forms of original/cleaned, used to rebuild chapter text
+    original_lines: list = field(default_factory=list, repr=False)
+    cleaned_lines: list = field(default_factory=list, repr=False)
 
 
-@dataclass
+@dataclass(**DATACLASS_SLOTS)
 class Chapter:
     """Represents a chapter from the .bookwash file."""
     number: int
@@ -52,6 +168,8 @@ class Chapter:
     needs_cleaning: bool
     raw_content: str  # All lines including change blocks
     changes: list = field(default_factory=list)
+    # raw_content in order as content line lists and Change objects
+    segments: list = field(default_factory=list, repr=False)
 
 
 @dataclass
@@ -67,11 +185,30 @@ class BookwashFile:
     metadata: dict = field(default_factory=dict)
 
 
+def decode_text(data: bytes) -> str:
+    """Decode UTF-8 file bytes, normalizing line endings like text-mode open()."""
+    text = data.decode('utf-8')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
 def parse_bookwash(filepath: str) -> BookwashFile:
-    """Parse a .bookwash file into structured data."""
-    with open(filepath, 'r', encoding='utf-8') as f:
-        content = f.read()
+    """Parse a .bookwash file into structured data.
     
+    The file is memory-mapped rather than read into one big string; only the
+    header and each chapter's slice are decoded.
+    """
+    with open(filepath, 'rb') as f:
+        # mmap can't map an empty file
+        if os.fstat(f.fileno()).st_size == 0:
+            return parse_bookwash_content(b'')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            return parse_bookwash_content(content)
+
+
+def parse_bookwash_content(content) -> BookwashFile:
+    """Parse raw .bookwash bytes (or an mmap of them) into structured data."""
     book = BookwashFile(
         title="",
         author="",
@@ -82,33 +219,33 @@ def parse_bookwash(filepath: str) -> BookwashFile:
     )
     
     # Parse header metadata
-    header_match = re.search(r'#BOOKWASH.*?(?=#SECTION:|#CHAPTER:|\Z)', content, re.DOTALL)
+    header_match = HEADER_RE.search(content)
     if header_match:
-        header = header_match.group(0)
+        header = decode_text(header_match.group(0))
         
-        title_match = re.search(r'#TITLE:\s*(.+)', header)
+        title_match = TITLE_RE.search(header)
         if title_match:
             book.title = title_match.group(1).strip()
         
-        author_match = re.search(r'#AUTHOR:\s*(.+)', header)
+        author_match = AUTHOR_RE.search(header)
         if author_match:
             book.author = author_match.group(1).strip()
         
-        lang_match = re.search(r'#LANGUAGE:\s*(.+)', header)
+        lang_match = LANGUAGE_RE.search(header)
         if lang_match:
             book.language = lang_match.group(1).strip()
         
-        source_match = re.search(r'#SOURCE:\s*(.+)', header)
+        source_match = SOURCE_RE.search(header)
         if source_match:
             book.source_epub = source_match.group(1).strip()
         
         # Parse assets folder path
-        assets_match = re.search(r'#ASSETS:\s*(.+)', header)
+        assets_match = ASSETS_RE.search(header)
         if assets_match:
             book.assets_folder = assets_match.group(1).strip()
         
         # Parse cover image filename
-        cover_match = re.search(r'#IMAGE:\s*(.+)', header)
+        cover_match = COVER_RE.search(header)
         if cover_match:
             book.cover_image = cover_match.group(1).strip()
         
@@ -117,38 +254,32 @@ def parse_bookwash(filepath: str) -> BookwashFile:
             book.title = os.path.splitext(book.source_epub)[0].replace('_', ' ').replace('-', ' ').title()
     
     # Parse chapters - support both #SECTION: (new) and #CHAPTER: (legacy)
-    # First try #SECTION: format
-    section_pattern = r'#SECTION:\s*(.+?)\s*\n'
-    chapter_pattern = r'#CHAPTER:\s*(\d+)\s*\n'
-    
     # Check which format is used
-    if re.search(section_pattern, content):
-        chapter_splits = re.split(section_pattern, content)
+    if SECTION_RE.search(content):
+        chapter_markers = list(SECTION_RE.finditer(content))
         use_section_format = True
     else:
-        chapter_splits = re.split(chapter_pattern, content)
+        chapter_markers = list(CHAPTER_RE.finditer(content))
         use_section_format = False
     
-    # chapter_splits: [header, ch_label/num, ch_content, ch_label/num, ch_content, ...]
+    # Each chapter runs from the end of its marker line to the next marker
     ch_counter = 0
-    for i in range(1, len(chapter_splits), 2):
-        if i + 1 >= len(chapter_splits):
-            break
-        
+    for i, marker in enumerate(chapter_markers):
         ch_counter += 1
         if use_section_format:
-            section_label = chapter_splits[i]
+            section_label = decode_text(marker.group(1))
             ch_num = ch_counter
         else:
-            ch_num = int(chapter_splits[i])
+            ch_num = int(marker.group(1))
             section_label = f"Chapter {ch_num}"
-        ch_content = chapter_splits[i + 1]
+        ch_end = chapter_markers[i + 1].start() if i + 1 < len(chapter_markers) else len(content)
+        ch_content = decode_text(content[marker.end():ch_end])
         
         # Parse chapter metadata
-        title_match = re.search(r'#TITLE:\s*(.+)', ch_content)
-        file_match = re.search(r'#FILE:\s*(.+)', ch_content)
-        rating_match = re.search(r'#RATING:\s*(.+)', ch_content)
-        needs_match = re.search(r'#NEEDS_CLEANING:\s*(.+)', ch_content)
+        title_match = TITLE_RE.search(ch_content)
+        file_match = FILE_RE.search(ch_content)
+        rating_match = RATING_RE.search(ch_content)
+        needs_match = NEEDS_CLEANING_RE.search(ch_content)
         
         chapter = Chapter(
             number=ch_num,
@@ -159,162 +290,156 @@ def parse_bookwash(filepath: str) -> BookwashFile:
             raw_content=ch_content  # Keep the full content for reconstruction
         )
         
-        # Parse change blocks
-        lines = ch_content.split('\n')
-        in_change = False
-        in_original = False
-        in_cleaned = False
-        current_change = None
-        
-        for line in lines:
-            # Handle change blocks
-            if line.startswith('#CHANGE:'):
-                in_change = True
-                change_id = line.split(':', 1)[1].strip()
-                current_change = Change(
-                    id=change_id,
-                    status='pending',
-                    reason='',
-                    original='',
-                    cleaned=''
-                )
-                continue
-            
-            if in_change:
-                if line.startswith('#STATUS:'):
-                    current_change.status = line.split(':', 1)[1].strip()
-                    continue
-                elif line.startswith('#CLEANED_FOR:'):
-                    current_change.reason = line.split(':', 1)[1].strip()
-                    continue
-                elif line.strip() == '#ORIGINAL':
-                    in_original = True
-                    in_cleaned = False
-                    continue
-                elif line.strip() == '#CLEANED':
-                    in_original = False
-                    in_cleaned = True
-                    continue
-                elif line.strip() == '#END':
-                    in_change = False
-                    in_original = False
-                    in_cleaned = False
-                    chapter.changes.append(current_change)
-                    current_change = None
-                    continue
-                elif in_original:
-                    if current_change.original:
-                        current_change.original += '\n'
-                    current_change.original += line
-                    continue
-                elif in_cleaned:
-                    if current_change.cleaned:
-                        current_change.cleaned += '\n'
-                    current_change.cleaned += line
-                    continue
+        # Parse change blocks, keeping the result for reconstruct_chapter_text
+        chapter.changes, chapter.segments = parse_chapter_body(ch_content)
         
         book.chapters.append(chapter)
     
     return book
 
 
-def reconstruct_chapter_text(chapter: Chapter, mode: str) -> str:
+def split_change_block(block: re.Match) -> tuple:
+    """
+    Sort the body lines of a CHANGE_BLOCK_RE match into their sections.
+    
+    Returns (status, reason, original_lines, cleaned_lines, other_lines), where
+    other_lines are lines before #ORIGINAL/#CLEANED other than #STATUS: and
+    #CLEANED_FOR: tags.
+    """
+    status = 'pending'
+    reason = ''
+    original_lines = []
+    cleaned_lines = []
+    other_lines = []
+    section = other_lines
+    
+    lines = block.group('body').split('\n')[:-1]
+    if block.group('tail') is not None:
+        lines.append(block.group('tail'))
+    
+    for line in lines:
+        if line.startswith('#STATUS:'):
+            status = line[8:].strip()  # len('#STATUS:')
+        elif line.startswith('#CLEANED_FOR:'):
+            reason = line[13:].strip()  # len('#CLEANED_FOR:')
+        else:
+            marker = line.strip()
+            if marker == '#ORIGINAL':
+                section = original_lines
+            elif marker == '#CLEANED':
+                section = cleaned_lines
+            else:
+                section.append(line)
+    
+    return status, reason, original_lines, cleaned_lines, other_lines
+
+
+def without_metadata_lines(lines: list) -> list:
+    """Drop bookwash metadata tag lines (#TITLE:, #RATING:, ...) from lines."""
+    return [line for line in lines
+            if not (line.startswith('#') and METADATA_LINE_RE.match(line))]
+
+
+def content_lines(text: str) -> list:
+    """Split text into lines, dropping metadata tag lines."""
+    lines = text.split('\n')
+    # Prose rarely contains '#', so most runs need no per-line check
+    if '#' in text:
+        lines = without_metadata_lines(lines)
+    return lines
+
+
+def parse_chapter_body(content: str) -> tuple:
+    """
+    Split chapter content into its change blocks and the text around them.
+    
+    Returns (changes, segments). changes lists every completed change block.
+    segments is the whole chapter in order: lists of content lines (metadata
+    tags dropped) interleaved with the same Change objects.
+    """
+    changes = []
+    segments = []
+    
+    pos = 0
+    for block in CHANGE_BLOCK_RE.finditer(content):
+        # Text between change blocks (ends with the newline before #CHANGE:)
+        lines = content_lines(content[pos:block.start()])[:-1]
+        
+        status, reason, original_lines, cleaned_lines, other_lines = split_change_block(block)
+        # Stray content inside the block but outside ORIGINAL/CLEANED
+        lines.extend(without_metadata_lines(other_lines))
+        if lines:
+            segments.append(lines)
+        
+        # A block without #END was never completed - not a change, and
+        # neither version of its text is output
+        if block.group('end') is not None:
+            change = Change(
+                id=block.group('id').strip(),
+                status=status,
+                reason=reason,
+                original='\n'.join(original_lines),
+                cleaned='\n'.join(cleaned_lines),
+                original_lines=original_lines,
+                cleaned_lines=cleaned_lines
+            )
+            changes.append(change)
+            segments.append(change)
+        
+        pos = block.end()
+    
+    # Text after the last change block
+    segments.append(content_lines(content[pos:]))
+    
+    return changes, segments
+
+
+def reconstruct_chapter_text(chapter: Chapter, mode: str) -> tuple:
     """
     Reconstruct the chapter text from raw content, applying changes based on mode.
     
+    Returns (text, applied_count), where applied_count is the number of
+    change blocks whose cleaned text was used.
+    
     This handles the complex case where text may be entirely within change blocks,
     especially for heavily-modified chapters.
     
     Strategy:
-    1. Parse the raw content line by line
-    2. Skip metadata lines (#TITLE:, #RATING:, etc.)
-    3. For text outside change blocks: keep as-is
-    4. For change blocks: output either #ORIGINAL or #CLEANED based on mode/status
+    1. Walk the chapter segments from parse_chapter_body
+    2. For text outside change blocks: keep as-is (metadata lines already dropped)
+    3. For change blocks: output either #ORIGINAL or #CLEANED based on mode/status
+    4. Collapse blank-line runs
     """
-    lines = chapter.raw_content.split('\n')
-    output_lines = []
-    
-    in_change = False
-    in_original = False
-    in_cleaned = False
-    current_original = []
-    current_cleaned = []
-    current_status = 'pending'
+    # Reuse the segments parse_bookwash produced; parse raw_content only for
+    # chapters built some other way
+    segments = chapter.segments or parse_chapter_body(chapter.raw_content)[1]
+    apply_statuses = APPLY_STATUSES.get(mode, frozenset())
     
-    # Regex to match any bookwash metadata tag: #UPPERCASE_TAG: or #UPPERCASE_TAG
-    import re
-    metadata_pattern = re.compile(r'^#[A-Z][A-Z0-9_]*:?')
-    
-    for line in lines:
-        # Handle change block markers first
-        if line.startswith('#CHANGE:'):
-            in_change = True
-            current_original = []
-            current_cleaned = []
-            current_status = 'pending'
-            continue
-        
-        if in_change:
-            if line.startswith('#STATUS:'):
-                current_status = line.split(':', 1)[1].strip()
-                continue
-            elif line.strip() == '#ORIGINAL':
-                in_original = True
-                in_cleaned = False
-                continue
-            elif line.strip() == '#CLEANED':
-                in_original = False
-                in_cleaned = True
-                continue
-            elif line.strip() == '#END':
-                # End of change block - decide what to output
-                should_apply = False
-                if mode == 'all':
-                    should_apply = current_status in ('pending', 'accepted')
-                elif mode == 'accepted':
-                    should_apply = current_status == 'accepted'
-                elif mode == 'none':
-                    should_apply = False
-                
-                if should_apply and current_cleaned:
-                    output_lines.extend(current_cleaned)
-                else:
-                    output_lines.extend(current_original)
-                
-                in_change = False
-                in_original = False
-                in_cleaned = False
-                continue
-            elif in_original:
-                current_original.append(line)
-                continue
-            elif in_cleaned:
-                current_cleaned.append(line)
-                continue
+    output_lines = []
+    applied_count = 0
+    for segment in segments:
+        if isinstance(segment, Change):
+            # Change block - output either #CLEANED or #ORIGINAL
+            if segment.status in apply_statuses and segment.cleaned_lines:
+                output_lines.extend(segment.cleaned_lines)
+                applied_count += 1
             else:
-                # Inside change block but not in ORIGINAL/CLEANED - skip metadata tags
-                if metadata_pattern.match(line):
-                    continue
-        
-        # Outside change blocks - skip any metadata tags
-        if metadata_pattern.match(line):
-            continue
-        
-        # Regular content line
-        output_lines.append(line)
+                output_lines.extend(segment.original_lines)
+        else:
+            output_lines.extend(segment)
     
     # Join lines and clean up excessive blank lines
     text = '\n'.join(output_lines)
     # Collapse multiple blank lines into one
-    while '\n\n\n' in text:
-        text = text.replace('\n\n\n', '\n\n')
-    return text.strip()
+    text = BLANK_LINES_RE.sub('\n\n', text)
+    return text.strip(), applied_count
 
 
-def apply_changes(chapter: Chapter, mode: str) -> str:
+def apply_changes(chapter: Chapter, mode: str) -> tuple:
     """
     Apply changes to chapter content based on mode.
     Uses reconstruct_chapter_text for proper handling of all content.
+    Returns (text, applied_count).
     
     Modes:
         'all' - Apply all pending and accepted changes
@@ -335,28 +460,15 @@ def convert_format_markers_to_html(text: str) -> str:
     - [U]...[/U] → <u>...</u>
     - [BLOCKQUOTE]...[/BLOCKQUOTE] → <blockquote>...</blockquote>
     """
-    # Map markers to HTML tags
-    replacements = [
-        ('[H1]', '<h1>'), ('[/H1]', '</h1>'),
-        ('[H2]', '<h2>'), ('[/H2]', '</h2>'),
-        ('[H3]', '<h3>'), ('[/H3]', '</h3>'),
-        ('[H4]', '<h4>'), ('[/H4]', '</h4>'),
-        ('[H5]', '<h5>'), ('[/H5]', '</h5>'),
-        ('[H6]', '<h6>'), ('[/H6]', '</h6>'),
-        ('[B]', '<strong>'), ('[/B]', '</strong>'),
-        ('[I]', '<em>'), ('[/I]', '</em>'),
-        ('[U]', '<u>'), ('[/U]', '</u>'),
-        ('[BLOCKQUOTE]', '<blockquote>'), ('[/BLOCKQUOTE]', '</blockquote>'),
-    ]
-    
-    result = text
-    for marker, html_tag in replacements:
-        result = result.replace(marker, html_tag)
+    # Plain prose has no markers at all
+    if '[' not in text:
+        return text
+    
+    # Map markers to HTML tags in a single pass
+    result = FORMAT_MARKER_RE.sub(lambda m: FORMAT_MARKERS[m.group(0)], text)
     
     # Convert [IMG: filename] markers to <img> tags
-    import re
-    result = re.sub(
-        r'\[IMG:\s*([^\]]+)\]',
+    result = IMG_RE.sub(
         r'<img src="images/\1" alt="" style="max-width:100%;"/>',
         result
     )
@@ -364,36 +476,35 @@ def convert_format_markers_to_html(text: str) -> str:
     return result
 
 
-def text_to_xhtml(text: str, title: str) -> str:
+def text_to_xhtml(text: str, title: str, escaped_title: Optional[str] = None) -> str:
     """Convert plain text chapter content to XHTML.
     
     Converts format markers like [H1], [B], [I] to proper HTML.
     Wraps non-heading paragraphs in <p> tags.
+    
+    Pass escaped_title if the caller has already HTML-escaped the title.
     """
-    # Split into paragraphs
-    paragraphs = text.strip().split('\n\n')
-    
-    xhtml_parts = []
-    xhtml_parts.append('<?xml version="1.0" encoding="UTF-8"?>')
-    xhtml_parts.append('<!DOCTYPE html>')
-    xhtml_parts.append('<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">')
-    xhtml_parts.append('<head>')
-    xhtml_parts.append(f'  <title>{html_escape(title)}</title>')
-    xhtml_parts.append('  <meta charset="UTF-8"/>')
-    xhtml_parts.append('  <style type="text/css">')
-    xhtml_parts.append('    body { font-family: Georgia, serif; margin: 2em; line-height: 1.6; }')
-    xhtml_parts.append('    h1, h2, h3, h4, h5, h6 { text-align: center; margin-top: 1.5em; margin-bottom: 1em; }')
-    xhtml_parts.append('    p { text-indent: 1.5em; margin: 0.5em 0; }')
-    xhtml_parts.append('    p.first { text-indent: 0; }')
-    xhtml_parts.append('    p.image { text-indent: 0; text-align: center; margin: 1em 0; }')
-    xhtml_parts.append('    img { max-width: 100%; height: auto; }')
-    xhtml_parts.append('    blockquote { margin: 1em 2em; font-style: italic; }')
-    xhtml_parts.append('  </style>')
-    xhtml_parts.append('</head>')
-    xhtml_parts.append('<body>')
+    if escaped_title is None:
+        escaped_title = html_escape(title)
+    
+    xhtml_parts = [XHTML_HEAD_TEMPLATE.format(title=escaped_title)]
+    
+    text = text.strip()
+    if not text:
+        # Empty chapter - just the title heading (if any)
+        if title and not SECTION_LABEL_RE.match(title):
+            xhtml_parts.append(f'  <h1>{escaped_title}</h1>')
+        xhtml_parts.append(XHTML_TAIL)
+        return '\n'.join(xhtml_parts)
+    
+    # Escape special HTML chars for the whole chapter at once, then split
+    # into paragraphs. Markers use [ ] so they survive escaping, and the
+    # title comparison below works on the escaped forms of both sides.
+    paragraphs = html_escape(text).split('\n\n')
     
     first_content_para = True
     title_emitted = False
+    title_lower = escaped_title.lower()
     
     for i, para in enumerate(paragraphs):
         para = para.strip()
@@ -405,31 +516,26 @@ def text_to_xhtml(text: str, title: str) -> str:
                      para.startswith('[H3]') or para.startswith('[H4]') or \
                      para.startswith('[H5]') or para.startswith('[H6]')
         
-        # Skip if this paragraph is just the chapter title (avoid duplication)
-        # Strip heading markers for comparison
-        para_text = para
-        for h in ['[H1]', '[/H1]', '[H2]', '[/H2]', '[H3]', '[/H3]', 
-                  '[H4]', '[/H4]', '[H5]', '[/H5]', '[H6]', '[/H6]']:
-            para_text = para_text.replace(h, '')
-        para_text = para_text.strip()
-        
-        if para_text.lower() == title.lower() and not title_emitted:
-            # Skip synthetic section labels like "[Section 2]"
-            if re.match(r'^\[Section \d+\]$', para_text):
-                title_emitted = True  # Mark as emitted so we don't add it later
+        # Skip if this paragraph is just the chapter title (avoid duplication).
+        # Only the first match counts, so stop checking once it's emitted.
+        if not title_emitted:
+            # Strip heading markers for comparison
+            para_text = HEADING_MARKER_RE.sub('', para).strip()
+            
+            if para_text.lower() == title_lower:
+                # Skip synthetic section labels like "[Section 2]"
+                if SECTION_LABEL_RE.match(para_text):
+                    title_emitted = True  # Mark as emitted so we don't add it later
+                    continue
+                # This is the title - emit it as H1 if it isn't already marked as one
+                if is_heading:
+                    # Already marked, convert and emit
+                    para_html = convert_format_markers_to_html(para)
+                    xhtml_parts.append(f'  {para_html}')
+                else:
+                    xhtml_parts.append(f'  <h1>{para_text}</h1>')
+                title_emitted = True
                 continue
-            # This is the title - emit it as H1 if it isn't already marked as one
-            if is_heading:
-                # Already marked, convert and emit
-                para_html = convert_format_markers_to_html(html_escape(para))
-                # The html_escape happened before conversion, need different order
-                para_html = convert_format_markers_to_html(para)
-                # Now escape just the text content (already has HTML structure)
-                xhtml_parts.append(f'  {para_html}')
-            else:
-                xhtml_parts.append(f'  <h1>{html_escape(para_text)}</h1>')
-            title_emitted = True
-            continue
         
         if is_heading:
             # It's a heading - convert markers and emit directly (no <p> wrapper)
@@ -441,10 +547,7 @@ def text_to_xhtml(text: str, title: str) -> str:
             is_image_para = para.strip().startswith('[IMG:') and para.strip().endswith(']')
             
             # Regular paragraph - wrap in <p> and convert inline markers
-            # First escape special HTML chars in the text
-            para_escaped = html_escape(para)
-            # Then convert our markers to HTML (they contain [ ] not < >)
-            para_html = convert_format_markers_to_html(para_escaped)
+            para_html = convert_format_markers_to_html(para)
             # Handle single newlines as line breaks
             para_html = para_html.replace('\n', '<br/>\n')
             
@@ -459,11 +562,10 @@ def text_to_xhtml(text: str, title: str) -> str:
     
     # If no title was emitted yet, add it at the top
     # But skip synthetic section labels like "[Section 2]"
-    if not title_emitted and title and not re.match(r'^\[Section \d+\]$', title):
-        xhtml_parts.insert(xhtml_parts.index('<body>') + 1, f'  <h1>{html_escape(title)}</h1>')
+    if not title_emitted and title and not SECTION_LABEL_RE.match(title):
+        xhtml_parts.insert(1, f'  <h1>{escaped_title}</h1>')
     
-    xhtml_parts.append('</body>')
-    xhtml_parts.append('</html>')
+    xhtml_parts.append(XHTML_TAIL)
     
     return '\n'.join(xhtml_parts)
 
@@ -477,25 +579,25 @@ def get_display_title(chapter: Chapter, mode: str) -> str:
     """
     title = chapter.title
     
-    if mode == 'none':
+    apply_statuses = APPLY_STATUSES.get(mode, frozenset())
+    if not apply_statuses:
         return title
     
+    title_lower = title.lower()
+    
     # Check if there's a change that modifies the title
     for change in chapter.changes:
-        original = change.original.strip()
-        cleaned = change.cleaned.strip()
+        # Changes that won't be applied can't affect the title, so skip them
+        # before doing any string work
+        if change.status not in apply_statuses:
+            continue
         
         # Check if this change is for the title (original matches title, cleaned is short)
-        if original.lower() == title.lower():
-            should_apply = False
-            if mode == 'all':
-                should_apply = change.status in ('pending', 'accepted')
-            elif mode == 'accepted':
-                should_apply = change.status == 'accepted'
-            
-            if should_apply and cleaned:
+        if change.original.strip().lower() == title_lower:
+            cleaned = change.cleaned.strip()
+            if cleaned:
                 # Get the first line of cleaned if it looks like a title
-                first_line = cleaned.split('\n')[0].strip()
+                first_line = cleaned.partition('\n')[0].strip()
                 # If the first line is short (< 100 chars) and doesn't end with period,
                 # it's likely a cleaned title
                 if len(first_line) < 100 and not first_line.endswith(('.', '!', '?')):
@@ -506,20 +608,42 @@ def get_display_title(chapter: Chapter, mode: str) -> str:
     return title
 
 
+def render_chapter(chapter: Chapter, mode: str) -> tuple:
+    """
+    Render a single chapter to XHTML.
+    
+    Returns (escaped_display_title, xhtml_bytes, applied_count); the escaped
+    title is reused for the nav entry. The XHTML comes back UTF-8 encoded so
+    that work happens in the worker, not in the serial zip-writing loop. Kept
+    at module level so it can be dispatched to worker processes.
+    """
+    # Get the display title (may be cleaned if it had profanity)
+    display_title = get_display_title(chapter, mode)
+    escaped_title = html_escape(display_title)
+    
+    # Apply changes based on mode
+    processed_text, applied_count = apply_changes(chapter, mode)
+    
+    # Convert to XHTML
+    xhtml_content = text_to_xhtml(processed_text, display_title, escaped_title)
+    return escaped_title, xhtml_content.encode('utf-8'), applied_count
+
+
 def create_epub(book: BookwashFile, output_path: str, mode: str, 
-                input_path: str = "", verbose: bool = False):
-    """Create an EPUB file from the processed bookwash data."""
+                input_path: str = "", verbose: bool = False,
+                compress_level: int = DEFAULT_COMPRESS_LEVEL):
+    """Create an EPUB file from the processed bookwash data.
     
-    # Create temp directory for EPUB structure
-    temp_dir = tempfile.mkdtemp(prefix='bookwash_epub_')
+    Every entry is written straight into the output ZIP; nothing is staged
+    on disk first.
+    """
     
-    try:
-        # EPUB structure
-        os.makedirs(os.path.join(temp_dir, 'META-INF'))
-        os.makedirs(os.path.join(temp_dir, 'OEBPS'))
-        os.makedirs(os.path.join(temp_dir, 'OEBPS', 'images'))
+    with zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED,
+                         compresslevel=compress_level) as epub:
+        # 1. Add mimetype (must be first, uncompressed)
+        epub.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
         
-        # Copy images from assets folder
+        # Add images from assets folder
         image_files = []  # List of (filename, media_type)
         if book.assets_folder and input_path:
             input_dir = os.path.dirname(os.path.abspath(input_path))
@@ -530,8 +654,17 @@ def create_epub(book: BookwashFile, output_path: str, mode: str,
                     file_lower = filename.lower()
                     if file_lower.endswith(('.jpg', '.jpeg', '.png', '.gif', '.svg')):
                         src = os.path.join(assets_path, filename)
-                        dst = os.path.join(temp_dir, 'OEBPS', 'images', filename)
-                        shutil.copy2(src, dst)
+                        arc_name = f'OEBPS/images/{filename}'
+                        # JPEG/PNG/GIF are already compressed; deflating them
+                        # again costs CPU for no size gain. Stream them in with
+                        # a large buffer (ZipFile.write copies 8 KiB at a time).
+                        if file_lower.endswith(('.jpg', '.jpeg', '.png', '.gif')):
+                            zinfo = zipfile.ZipInfo.from_file(src, arc_name)
+                            zinfo.compress_type = zipfile.ZIP_STORED
+                            with open(src, 'rb') as image_file, epub.open(zinfo, 'w') as dest:
+                                shutil.copyfileobj(image_file, dest, IMAGE_COPY_BUFFER_SIZE)
+                        else:
+                            epub.write(src, arc_name, compress_type=zipfile.ZIP_DEFLATED)
                         
                         # Determine media type
                         if file_lower.endswith('.jpg') or file_lower.endswith('.jpeg'):
@@ -554,15 +687,11 @@ def create_epub(book: BookwashFile, output_path: str, mode: str,
                                 print(f"  Auto-detected cover: {filename}")
                         
                         if verbose:
-                            print(f"  Copied image: {filename}")
+                            print(f"  Added image: {filename}")
             else:
                 if verbose:
                     print(f"  Warning: Assets folder not found: {assets_path}")
         
-        # 1. Create mimetype file (must be first, uncompressed)
-        with open(os.path.join(temp_dir, 'mimetype'), 'w') as f:
-            f.write('application/epub+zip')
-        
         # 2. Create container.xml
         container_xml = '''<?xml version="1.0" encoding="UTF-8"?>
 <container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
@@ -570,45 +699,40 @@ def create_epub(book: BookwashFile, output_path: str, mode: str,
     <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
   </rootfiles>
 </container>'''
-        with open(os.path.join(temp_dir, 'META-INF', 'container.xml'), 'w') as f:
-            f.write(container_xml)
+        epub.writestr('META-INF/container.xml', container_xml, compress_type=zipfile.ZIP_DEFLATED)
         
         # 3. Create chapter XHTML files
         manifest_items = []
         spine_items = []
         toc_items = []
         
-        for chapter in book.chapters:
-            # Get the display title (may be cleaned if it had profanity)
-            display_title = get_display_title(chapter, mode)
-            
-            # Apply changes based on mode
-            processed_text = apply_changes(chapter, mode)
-            
-            # Convert to XHTML
-            xhtml_content = text_to_xhtml(processed_text, display_title)
-            
+        # Chapters render independently, so spread them across CPU cores
+        # for long books. Zip writes stay serial and in chapter order.
+        if len(book.chapters) >= PARALLEL_RENDER_MIN_CHAPTERS and (os.cpu_count() or 1) > 1:
+            with ProcessPoolExecutor() as executor:
+                rendered = list(executor.map(render_chapter, book.chapters,
+                                             itertools.repeat(mode),
+                                             chunksize=PARALLEL_RENDER_CHUNKSIZE))
+        else:
+            rendered = [render_chapter(chapter, mode) for chapter in book.chapters]
+        
+        for chapter, (escaped_title, xhtml_content, change_count) in zip(book.chapters, rendered):
             # Write chapter file
             chapter_filename = f'chapter{chapter.number:03d}.xhtml'
-            chapter_path = os.path.join(temp_dir, 'OEBPS', chapter_filename)
-            with open(chapter_path, 'w', encoding='utf-8') as f:
-                f.write(xhtml_content)
+            epub.writestr(f'OEBPS/{chapter_filename}', xhtml_content, compress_type=zipfile.ZIP_DEFLATED)
             
             chapter_id = f'chapter{chapter.number:03d}'
             manifest_items.append(f'    <item id="{chapter_id}" href="{chapter_filename}" media-type="application/xhtml+xml"/>')
             spine_items.append(f'    <itemref idref="{chapter_id}"/>')
-            toc_items.append((chapter.number, display_title, chapter_filename))
+            toc_items.append((chapter.number, escaped_title, chapter_filename))
             
             if verbose:
-                change_count = sum(1 for c in chapter.changes if 
-                                   (mode == 'all' and c.status in ('pending', 'accepted')) or
-                                   (mode == 'accepted' and c.status == 'accepted'))
                 print(f"  Chapter {chapter.number}: {chapter.title} ({change_count} changes applied)")
         
         # 4. Create nav.xhtml (EPUB3 navigation)
         nav_items = '\n'.join([
-            f'        <li><a href="{fn}">{html_escape(title)}</a></li>'
-            for num, title, fn in toc_items
+            f'        <li><a href="{fn}">{escaped_title}</a></li>'
+            for num, escaped_title, fn in toc_items
         ])
         
         nav_xhtml = f'''<?xml version="1.0" encoding="UTF-8"?>
@@ -628,8 +752,7 @@ def create_epub(book: BookwashFile, output_path: str, mode: str,
 </body>
 </html>'''
         
-        with open(os.path.join(temp_dir, 'OEBPS', 'nav.xhtml'), 'w', encoding='utf-8') as f:
-            f.write(nav_xhtml)
+        epub.writestr('OEBPS/nav.xhtml', nav_xhtml, compress_type=zipfile.ZIP_DEFLATED)
         
         manifest_items.append('    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>')
         
@@ -637,7 +760,7 @@ def create_epub(book: BookwashFile, output_path: str, mode: str,
         cover_id = None
         for filename, media_type in image_files:
             # Create safe id from filename
-            img_id = 'img_' + re.sub(r'[^a-zA-Z0-9]', '_', filename)
+            img_id = 'img_' + NON_ID_CHAR_RE.sub('_', filename)
             # Check if this is the cover image
             is_cover = (book.cover_image and filename == book.cover_image)
             if is_cover:
@@ -663,8 +786,7 @@ def create_epub(book: BookwashFile, output_path: str, mode: str,
   <img src="images/{html_escape(book.cover_image)}" alt="Cover"/>
 </body>
 </html>'''
-            with open(os.path.join(temp_dir, 'OEBPS', 'cover.xhtml'), 'w', encoding='utf-8') as f:
-                f.write(cover_xhtml)
+            epub.writestr('OEBPS/cover.xhtml', cover_xhtml, compress_type=zipfile.ZIP_DEFLATED)
             
             # Add cover page to manifest and spine (at the beginning)
             manifest_items.insert(0, '    <item id="cover" href="cover.xhtml" media-type="application/xhtml+xml"/>')
@@ -675,7 +797,6 @@ def create_epub(book: BookwashFile, output_path: str, mode: str,
         spine_str = '\n'.join(spine_items)
         
         # Generate a unique identifier
-        import hashlib
         book_id = hashlib.md5(f"{book.title}{book.author}".encode()).hexdigest()[:16]
         
         # Build cover metadata for EPUB2 compatibility (Apple Books uses this)
@@ -700,34 +821,10 @@ def create_epub(book: BookwashFile, output_path: str, mode: str,
   </spine>
 </package>'''
         
-        with open(os.path.join(temp_dir, 'OEBPS', 'content.opf'), 'w', encoding='utf-8') as f:
-            f.write(content_opf)
-        
-        # 6. Create the EPUB (ZIP) file
-        # mimetype must be first and uncompressed
-        with zipfile.ZipFile(output_path, 'w') as epub:
-            # Add mimetype first, uncompressed
-            epub.write(
-                os.path.join(temp_dir, 'mimetype'),
-                'mimetype',
-                compress_type=zipfile.ZIP_STORED
-            )
-            
-            # Add all other files
-            for root, dirs, files in os.walk(temp_dir):
-                for file in files:
-                    if file == 'mimetype':
-                        continue
-                    file_path = os.path.join(root, file)
-                    arc_name = os.path.relpath(file_path, temp_dir)
-                    epub.write(file_path, arc_name, compress_type=zipfile.ZIP_DEFLATED)
-        
-        if verbose:
-            print(f"\nEPUB created: {output_path}")
-        
-    finally:
-        # Clean up temp directory
-        shutil.rmtree(temp_dir)
+        epub.writestr('OEBPS/content.opf', content_opf, compress_type=zipfile.ZIP_DEFLATED)
+    
+    if verbose:
+        print(f"\nEPUB created: {output_path}")
 
 
 def main():
@@ -742,6 +839,9 @@ def main():
                         help='Only apply changes marked as accepted')
     parser.add_argument('--original', action='store_true',
                         help="Don't apply any changes, rebuild original")
+    parser.add_argument('--compress-level', type=int, choices=range(10),
+                        default=DEFAULT_COMPRESS_LEVEL, metavar='0-9',
+                        help=f'Deflate level for text entries (default: {DEFAULT_COMPRESS_LEVEL})')
     parser.add_argument('--verbose', '-v', action='store_true',
                         help='Verbose output')
     
@@ -786,10 +886,11 @@ def main():
     print(f"  Chapters: {len(book.chapters)}")
     
     # Count changes
-    total_changes = sum(len(ch.changes) for ch in book.chapters)
-    pending = sum(1 for ch in book.chapters for c in ch.changes if c.status == 'pending')
-    accepted = sum(1 for ch in book.chapters for c in ch.changes if c.status == 'accepted')
-    rejected = sum(1 for ch in book.chapters for c in ch.changes if c.status == 'rejected')
+    status_counts = Counter(c.status for ch in book.chapters for c in ch.changes)
+    total_changes = sum(status_counts.values())
+    pending = status_counts['pending']
+    accepted = status_counts['accepted']
+    rejected = status_counts['rejected']
     
     print(f"  Changes:  {total_changes} total ({pending} pending, {accepted} accepted, {rejected} rejected)")
     print()
@@ -807,7 +908,8 @@ def main():
         print()
     
     # Create the EPUB
-    create_epub(book, output_path, mode, input_path=args.input, verbose=args.verbose)
+    create_epub(book, output_path, mode, input_path=args.input, verbose=args.verbose,
+                compress_level=args.compress_level)
     
     print()
     print(f"✓ EPUB created successfully: {output_path}")
@@ -22,13 +22,33 @@ Limitations:
 """
 from __future__ import annotations
 import argparse
+import functools
+import os
+import posixpath
 import zipfile
-import io
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 import re
-import xml.etree.ElementTree as ET
+import shutil
+import struct
+
+# lxml parses and serializes OPF/NCX in C; the stdlib parser is the fallback
+try:
+    from lxml import etree as ET
+    HAS_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    HAS_LXML = False
+
+# EPUBs are untrusted input: never expand entities, load DTDs or touch the
+# network (lxml < 5 resolves external entities by default). The text is
+# always read as UTF-8, whatever the XML declaration says.
+if HAS_LXML:
+    XML_PARSER = ET.XMLParser(resolve_entities=False, no_network=True, load_dtd=False, encoding='utf-8')
+else:
+    XML_PARSER = None
 
 NAMESPACES = {
     'opf': 'http://www.idpf.org/2007/opf',
@@ -36,6 +56,28 @@ NAMESPACES = {
     'ncx': 'http://www.daisy.org/z3986/2005/ncx/'
 }
 
+# Common non-ASCII punctuation as UTF-8 bytes, none of it matched by \w: Latin-1
+# punctuation and nbsp, General Punctuation dashes/quotes/ellipsis, CJK and
+# fullwidth punctuation. Skipping it keeps most word runs pure ASCII.
+NON_ASCII_PUNCT = (rb'\xc2[\xa0-\xa9\xab-\xb1\xb4\xb6-\xb8\xbb\xbf]|\xe2\x80[\x80-\xbf]'
+                   rb'|\xe3\x80[\x80-\x84\x88-\x91]|\xef\xbc[\x80-\x8f\x9a-\xa0]')
+
+# Word scan over the raw UTF-8 bytes of a chapter. Script/style blocks, tags,
+# entities and that punctuation are skipped; the 'word' group is a run of
+# ASCII word chars and other non-ASCII bytes.
+WORD_TOKEN_RE = re.compile(
+    rb'<(script|style)[^>]*>.*?</\1>|<[^>]+>|&[a-zA-Z0-9#]+;|' + NON_ASCII_PUNCT +
+    rb'|(?P<word>(?:\w|(?!' + NON_ASCII_PUNCT + rb')[\x80-\xff])+)',
+    re.I | re.S
+)
+
+# Non-ASCII runs are decoded and re-split with the Unicode word class, so
+# symbols, emoji and invalid bytes count exactly as in the decoded text
+WORD_RE = re.compile(r'\w+')
+
+# Upper bound on threads reading and word-checking spine chapters
+WORD_COUNT_MAX_WORKERS = 8
+
 for prefix, uri in NAMESPACES.items():
     ET.register_namespace(prefix if prefix != 'dc' else 'dc', uri)
 
@@ -46,7 +88,11 @@ class OpfData:
     manifest: ET.Element
     spine: ET.Element
     metadata: ET.Element
-    id_to_item: dict  # id -> (href, media-type)
+    href_by_id: dict  # manifest id -> href
+    media_by_id: dict  # manifest id -> media-type
+    opf_dir: str  # directory of the OPF inside the archive ('' at the root)
+    spine_itemrefs: list  # spine <itemref> elements, kept in step with spine
+    spine_idrefs: list  # idrefs of spine_itemrefs that have one
 
 @dataclass
 class NcxData:
@@ -55,11 +101,20 @@ class NcxData:
     navMap: ET.Element | None
 
 
+def parse_xml(content: bytes) -> ET.Element:
+    """Parse container/OPF/NCX bytes, replacing invalid UTF-8 rather than failing."""
+    text = content.decode('utf-8', errors='replace')
+    if HAS_LXML:
+        # lxml rejects str input that carries an encoding declaration
+        return ET.fromstring(text.encode('utf-8'), XML_PARSER)
+    return ET.fromstring(text)
+
+
 def find_container_opf(zipf: zipfile.ZipFile) -> str:
     try:
         with zipf.open('META-INF/container.xml') as f:
-            content = f.read().decode('utf-8', errors='replace')
-        root = ET.fromstring(content)
+            content = f.read()
+        root = parse_xml(content)
         rootfile = root.find('.//{urn:oasis:names:tc:opendocument:xmlns:container}rootfile')
         if rootfile is None:
             raise RuntimeError('rootfile element not found in container.xml')
@@ -73,8 +128,8 @@ def find_container_opf(zipf: zipfile.ZipFile) -> str:
 
 def parse_opf(zipf: zipfile.ZipFile, opf_path: str) -> OpfData:
     with zipf.open(opf_path) as f:
-        content = f.read().decode('utf-8', errors='replace')
-    tree = ET.ElementTree(ET.fromstring(content))
+        content = f.read()
+    tree = ET.ElementTree(parse_xml(content))
     root = tree.getroot()
 
     manifest = root.find('opf:manifest', NAMESPACES)
@@ -83,81 +138,109 @@ def parse_opf(zipf: zipfile.ZipFile, opf_path: str) -> OpfData:
     if manifest is None or spine is None:
         raise RuntimeError('manifest or spine not found in OPF')
 
-    id_to_item = {}
+    href_by_id = {}
+    media_by_id = {}
     for item in manifest.findall('opf:item', NAMESPACES):
         id_attr = item.get('id')
         href = item.get('href')
         media_type = item.get('media-type')
         if id_attr and href and media_type:
-            id_to_item[id_attr] = (href, media_type)
+            href_by_id[id_attr] = href
+            media_by_id[id_attr] = media_type
 
-    return OpfData(opf_path, tree, manifest, spine, metadata, id_to_item)
+    opf_dir = posixpath.dirname(opf_path)
+    spine_itemrefs = spine.findall('opf:itemref', NAMESPACES)
+    spine_idrefs = [idref for idref in (i.get('idref') for i in spine_itemrefs) if idref]
+    return OpfData(opf_path, tree, manifest, spine, metadata, href_by_id, media_by_id, opf_dir,
+                   spine_itemrefs, spine_idrefs)
 
 
 def parse_ncx(zipf: zipfile.ZipFile, opf: OpfData) -> NcxData:
     # Find NCX via manifest item with media-type application/x-dtbncx+xml or id 'ncx'
     ncx_item_id = None
-    for id_, (href, media_type) in opf.id_to_item.items():
+    for id_, media_type in opf.media_by_id.items():
         if media_type == 'application/x-dtbncx+xml' or id_ == 'ncx':
             ncx_item_id = id_
             break
     if not ncx_item_id:
         return NcxData(None, None, None)
-    href = opf.id_to_item[ncx_item_id][0]
-    ncx_path = str(Path(opf.path).parent / href) if '/' in opf.path else href
+    href = opf.href_by_id[ncx_item_id]
+    ncx_path = f"{opf.opf_dir}/{href}" if opf.opf_dir else href
     try:
         with zipf.open(ncx_path) as f:
-            content = f.read().decode('utf-8', errors='replace')
-        tree = ET.ElementTree(ET.fromstring(content))
+            content = f.read()
+        tree = ET.ElementTree(parse_xml(content))
         navMap = tree.getroot().find('ncx:navMap', NAMESPACES)
         return NcxData(ncx_path, tree, navMap)
     except KeyError:
         return NcxData(None, None, None)
 
 
-def gather_spine_ids(opf: OpfData) -> list[str]:
-    ids = []
-    for itemref in opf.spine.findall('opf:itemref', NAMESPACES):
-        idref = itemref.get('idref')
-        if idref:
-            ids.append(idref)
-    return ids
-
-
-def extract_text_and_count_words(html_bytes: bytes) -> int:
-    text = html_bytes.decode('utf-8', errors='replace')
-    # Remove scripts/styles
-    text = re.sub(r'<(script|style)[^>]*>.*?</\1>', ' ', text, flags=re.I | re.S)
-    # Strip tags
-    text = re.sub(r'<[^>]+>', ' ', text)
-    # Collapse entities (simple) & whitespace
-    text = re.sub(r'&[a-zA-Z0-9#]+;', ' ', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    if not text:
-        return 0
-    return len(re.findall(r'\w+', text))
+def chapter_meets_threshold(html_bytes: bytes, min_words: int) -> bool:
+    """Whether the chapter has at least min_words words; stops scanning once it does.
+
+    Words are counted as \\w+ runs in the decoded text with scripts, styles, tags
+    and entities removed.
+    """
+    if min_words <= 0:
+        return True
+    words = 0
+    for match in WORD_TOKEN_RE.finditer(html_bytes):
+        word = match.group('word')
+        if word is None:
+            continue
+        if word.isascii():
+            words += 1
+        else:
+            words += len(WORD_RE.findall(word.decode('utf-8', errors='replace')))
+        if words >= min_words:
+            return True
+    return False
+
+def check_entries_threshold(zipf: zipfile.ZipFile, chapter_paths: list[str | None], min_words: int) -> list[bool]:
+    """chapter_meets_threshold for each chapter entry; missing entries (or None paths) have 0 words."""
+    meets = []
+    for chapter_path in chapter_paths:
+        data = b''
+        if chapter_path is not None:
+            try:
+                with zipf.open(chapter_path) as f:
+                    data = f.read()
+            except KeyError:
+                pass
+        meets.append(chapter_meets_threshold(data, min_words))
+    return meets
+
+
+def check_entries_threshold_in_file(input_path: str, chapter_paths: list[str | None], min_words: int) -> list[bool]:
+    """check_entries_threshold on a private handle of the EPUB, for worker threads."""
+    with zipfile.ZipFile(input_path, 'r') as zipf:
+        return check_entries_threshold(zipf, chapter_paths, min_words)
 
 def choose_content_indices(zipf: zipfile.ZipFile, opf: OpfData, spine_ids: list[str], count: int, min_words: int, verbose: bool) -> list[int]:
     """Select indices ensuring first/middle/last with >= min_words, falling back gracefully."""
-    word_counts: list[int] = []
-    opf_dir = str(Path(opf.path).parent)
+    chapter_paths: list[str | None] = []
     for idref in spine_ids:
-        href, media_type = opf.id_to_item.get(idref, (None, None))
+        href = opf.href_by_id.get(idref)
         if href is None:
-            word_counts.append(0)
+            chapter_paths.append(None)
             continue
-        chapter_path = str(Path(opf_dir) / href) if opf_dir else href
-        try:
-            with zipf.open(chapter_path) as f:
-                data = f.read()
-            wc = extract_text_and_count_words(data)
-        except KeyError:
-            wc = 0
-        word_counts.append(wc)
+        chapter_paths.append(f"{opf.opf_dir}/{href}" if opf.opf_dir else href)
+    # Inflating chapters releases the GIL, so spread long spines over a few
+    # threads, each with its own handle on the input (ZipFile isn't thread-safe)
+    workers = min(WORD_COUNT_MAX_WORKERS, os.cpu_count() or 1, len(chapter_paths))
+    if workers > 1 and zipf.filename:
+        batch_size = -(-len(chapter_paths) // workers)
+        batches = [chapter_paths[i:i + batch_size] for i in range(0, len(chapter_paths), batch_size)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            check = functools.partial(check_entries_threshold_in_file, zipf.filename, min_words=min_words)
+            meets = [ok for batch in executor.map(check, batches) for ok in batch]
+    else:
+        meets = check_entries_threshold(zipf, chapter_paths, min_words)
     if verbose:
-        print(f"Computed word counts for {len(spine_ids)} spine items.")
+        print(f"Checked word counts for {len(spine_ids)} spine items.")
     # Build list of indices meeting threshold
-    eligible = [i for i, wc in enumerate(word_counts) if wc >= min_words]
+    eligible = [i for i, ok in enumerate(meets) if ok]
     if verbose:
         print(f"Eligible (>= {min_words} words): {eligible[:15]}{' ...' if len(eligible)>15 else ''}")
     if not eligible:
@@ -205,21 +288,37 @@ def _structural_indices(total: int, count: int) -> list[int]:
     return sorted(indices)
 
 
+def remove_children(parent: ET.Element, children: list):
+    """Detach children from parent in one pass (each Element.remove is a linear scan)."""
+    if not children:
+        return
+    doomed = {id(child) for child in children}
+    parent[:] = [child for child in parent if id(child) not in doomed]
+
+
 def clip_opf(opf: OpfData, keep_idrefs: set[str], append_title: bool):
-    # Adjust spine
-    original_itemrefs = list(opf.spine.findall('opf:itemref', NAMESPACES))
-    for itemref in original_itemrefs:
-        if itemref.get('idref') not in keep_idrefs:
-            opf.spine.remove(itemref)
+    # Adjust spine, remembering what was in the reading order originally
+    itemrefs_ids = set(opf.spine_idrefs)
+    kept_itemrefs = []
+    removed_itemrefs = []
+    for itemref in opf.spine_itemrefs:
+        if itemref.get('idref') in keep_idrefs:
+            kept_itemrefs.append(itemref)
+        else:
+            removed_itemrefs.append(itemref)
+    remove_children(opf.spine, removed_itemrefs)
+    opf.spine_itemrefs = kept_itemrefs
+    opf.spine_idrefs = [idref for idref in opf.spine_idrefs if idref in keep_idrefs]
     # Adjust manifest: remove xhtml items not in keep set if they were in spine
-    for item in list(opf.manifest.findall('opf:item', NAMESPACES)):
+    removed_items = []
+    for item in opf.manifest.findall('opf:item', NAMESPACES):
         id_attr = item.get('id')
         media_type = item.get('media-type')
         if media_type == 'application/xhtml+xml' and id_attr not in keep_idrefs:
             # Only remove if it was part of reading order originally
-            itemrefs_ids = gather_spine_ids(opf)
             if id_attr in itemrefs_ids:
-                opf.manifest.remove(item)
+                removed_items.append(item)
+    remove_children(opf.manifest, removed_items)
     # Optionally modify title
     if append_title and opf.metadata is not None:
         title_el = opf.metadata.find('dc:title', NAMESPACES)
@@ -228,15 +327,16 @@ def clip_opf(opf: OpfData, keep_idrefs: set[str], append_title: bool):
 
 
 def clip_ncx(ncx: NcxData, keep_hrefs: set[str]):
-    if not ncx.navMap:
+    if ncx.navMap is None or len(ncx.navMap) == 0:
         return
     # Map href forms to allow relative path variations
     def href_matches(src: str) -> bool:
         # Strip fragment portion
         base = src.split('#', 1)[0]
         return base in keep_hrefs
-    navPoints = list(ncx.navMap.findall('ncx:navPoint', NAMESPACES))
+    navPoints = ncx.navMap.findall('ncx:navPoint', NAMESPACES)
     kept = []
+    removed = []
     for nav in navPoints:
         content_el = nav.find('ncx:content', NAMESPACES)
         if content_el is None:
@@ -245,23 +345,73 @@ def clip_ncx(ncx: NcxData, keep_hrefs: set[str]):
         if href_matches(src):
             kept.append(nav)
         else:
-            ncx.navMap.remove(nav)
+            removed.append(nav)
+    remove_children(ncx.navMap, removed)
     # Reassign playOrder sequentially
     for idx, nav in enumerate(kept, start=1):
         nav.set('playOrder', str(idx))
         nav.set('id', f'navPoint-{idx}')
 
 
+def copy_entry_raw(zipf: zipfile.ZipFile, out_zip: zipfile.ZipFile, info: zipfile.ZipInfo):
+    """Copy an entry's compressed bytes into out_zip without inflating/deflating them.
+
+    zipfile has no public API for this, so read the payload after the source
+    local header and write a fresh local header + payload at the end of
+    out_zip, registering the entry for its central directory. If zipfile's
+    internals ever change shape, fall back to a streaming copy through the
+    public API; build_output_epub verifies the result with testzip().
+    """
+    zi = zipfile.ZipInfo(info.filename, info.date_time)
+    zi.compress_type = info.compress_type
+    zi.create_system = info.create_system
+    zi.external_attr = info.external_attr
+    zi.comment = info.comment
+    if info.flag_bits & 0x1:
+        # Encrypted entries carry an encryption header; copy them the slow way
+        out_zip.writestr(zi, zipf.read(info))
+        return
+    # Touch every private attribute used below before writing anything
+    try:
+        src_lock, src_fp = zipf._lock, zipf.fp
+        out_lock, out_fp = out_zip._lock, out_zip.fp
+        out_zip._writing, out_zip._seekable, out_zip.start_dir, out_zip.NameToInfo
+    except AttributeError:
+        # Inflates and re-deflates, but still streams rather than loading the entry
+        with zipf.open(info) as src, out_zip.open(zi, 'w') as dst:
+            shutil.copyfileobj(src, dst, 1 << 16)
+        return
+
+    with src_lock:
+        src_fp.seek(info.header_offset)
+        fheader = struct.unpack(zipfile.structFileHeader, src_fp.read(zipfile.sizeFileHeader))
+        if fheader[0] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile(f'Bad local file header for {info.filename}')
+        # Skip the file name and extra field (fields 10 and 11 are their lengths)
+        src_fp.seek(fheader[10] + fheader[11], 1)
+        raw = src_fp.read(info.compress_size)
+
+    zi.CRC = info.CRC
+    zi.compress_size = info.compress_size
+    zi.file_size = info.file_size
+    with out_lock:
+        # Same guard ZipFile.writestr applies
+        if out_zip._writing:
+            raise ValueError("Can't write to ZIP archive while an open writing handle exists")
+        if out_zip._seekable:
+            out_fp.seek(out_zip.start_dir)
+        zi.header_offset = out_fp.tell()
+        out_fp.write(zi.FileHeader())
+        out_fp.write(raw)
+        out_zip.start_dir = out_fp.tell()
+        out_zip.filelist.append(zi)
+        out_zip.NameToInfo[zi.filename] = zi
+        out_zip._didModify = True
+
+
 def build_output_epub(zipf: zipfile.ZipFile, opf: OpfData, ncx: NcxData, keep_href_set: set[str], output_path: Path, verbose: bool):
-    # Prepare modified OPF and NCX XML strings
-    opf_xml = io.BytesIO()
-    opf.tree.write(opf_xml, encoding='utf-8', xml_declaration=True)
-    ncx_xml = None
-    if ncx.path and ncx.tree:
-        ncx_xml = io.BytesIO()
-        ncx.tree.write(ncx_xml, encoding='utf-8', xml_declaration=True)
-
-    with zipfile.ZipFile(output_path, 'w') as out_zip:
+    # New entries (the rewritten OPF/NCX) are deflated; copied ones keep their method
+    with zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED) as out_zip:
         # Write mimetype first (stored, no compression)
         try:
             mimetype_data = zipf.read('mimetype')
@@ -275,30 +425,37 @@ def build_output_epub(zipf: zipfile.ZipFile, opf: OpfData, ncx: NcxData, keep_hr
             out_zip.writestr(zi, b'application/epub+zip')
 
         # Copy all original files except removed chapter xhtml + replaced OPF/NCX
+        # (mimetype was written above; modified OPF/NCX are written below)
+        skip = {'mimetype', opf.path}
+        if ncx.path:
+            skip.add(ncx.path)
+        # Kept chapter hrefs are relative to the OPF dir; match on full archive paths
+        opf_prefix = f"{opf.opf_dir}/" if opf.opf_dir else ''
+        kept_chapter_paths = {opf_prefix + href for href in keep_href_set}
+        # Any other xhtml/html file is a chapter we removed
         for name in zipf.namelist():
-            if name == 'mimetype':
-                continue
-            if name == opf.path:
-                # Will write modified opf later
-                continue
-            if ncx.path and name == ncx.path:
+            if name not in kept_chapter_paths and name not in skip and name.lower().endswith(('.xhtml', '.html')):
+                skip.add(name)
+                if verbose:
+                    print(f"Skipping removed chapter file: {name}")
+        for info in zipf.infolist():
+            if info.filename in skip:
                 continue
-            # If it's an xhtml chapter we removed, skip
-            if name.lower().endswith(('.xhtml', '.html')):
-                # Compare href relative to OPF dir
-                opf_dir = str(Path(opf.path).parent)
-                rel = name[len(opf_dir)+1:] if opf_dir and name.startswith(opf_dir + '/') else name
-                if rel not in keep_href_set:
-                    if verbose:
-                        print(f"Skipping removed chapter file: {name}")
-                    continue
-            data = zipf.read(name)
-            out_zip.writestr(name, data)
-
-        # Write modified OPF
-        out_zip.writestr(opf.path, opf_xml.getvalue())
-        if ncx.path and ncx_xml is not None:
-            out_zip.writestr(ncx.path, ncx_xml.getvalue())
+            # Unmodified resource: copy the compressed bytes as-is
+            copy_entry_raw(zipf, out_zip, info)
+
+        # Write modified OPF and NCX, serializing straight into the zip entries
+        with out_zip.open(opf.path, 'w') as f:
+            opf.tree.write(f, encoding='utf-8', xml_declaration=True)
+        if ncx.path and ncx.tree:
+            with out_zip.open(ncx.path, 'w') as f:
+                ncx.tree.write(f, encoding='utf-8', xml_declaration=True)
+
+    # Raw-copied entries bypass zipfile's writer; re-read the archive to be sure it is sound
+    with zipfile.ZipFile(output_path) as check_zip:
+        bad_entry = check_zip.testzip()
+    if bad_entry is not None:
+        raise zipfile.BadZipFile(f'Corrupt entry in clipped EPUB: {bad_entry}')
 
     if verbose:
         print(f"Wrote clipped EPUB: {output_path}")
@@ -326,7 +483,7 @@ def main():
         opf = parse_opf(zipf, opf_path)
         ncx = parse_ncx(zipf, opf)
 
-        spine_ids = gather_spine_ids(opf)
+        spine_ids = opf.spine_idrefs
         if not spine_ids:
             print('No spine itemrefs found; cannot proceed.', file=sys.stderr)
             sys.exit(1)
@@ -344,18 +501,17 @@ def main():
         # Determine hrefs for kept chapters
         keep_hrefs = set()
         for idref in keep_idrefs:
-            href, media_type = opf.id_to_item.get(idref, (None, None))
+            href = opf.href_by_id.get(idref)
             if href:
                 # Accept common HTML media types
-                if media_type in ('application/xhtml+xml', 'text/html', 'application/x-dtbook+xml'):
+                if opf.media_by_id[idref] in ('application/xhtml+xml', 'text/html', 'application/x-dtbook+xml'):
                     keep_hrefs.add(href)
 
         # If we unexpectedly only kept 1 chapter, provide diagnostic hints (always print in verbose).
         if args.verbose and len(keep_hrefs) < len(keep_idrefs):
             print("Warning: fewer hrefs retained than idrefs.")
             for idref in keep_idrefs:
-                href, media_type = opf.id_to_item.get(idref, (None, None))
-                print(f"  idref={idref} media-type={media_type} href={href}")
+                print(f"  idref={idref} media-type={opf.media_by_id.get(idref)} href={opf.href_by_id.get(idref)}")
             print("  (Only hrefs with HTML/XHTML media types are included.)")
 
         # Clip NCX
@@ -13,25 +13,71 @@ If output is not specified, uses the input filename with .bookwash extension.
 
 import argparse
 import functools
+import html
 import os
 import re
 import shutil
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
-from html.parser import HTMLParser
 from pathlib import Path
-from xml.etree import ElementTree as ET
+
+# lxml parses container/OPF/NCX XML in C; the stdlib parser is the fallback
+try:
+    from lxml import etree as ET
+    HAS_LXML = True
+except ImportError:
+    from xml.etree import ElementTree as ET
+    HAS_LXML = False
+
+# EPUBs are untrusted uploads: never expand entities, load DTDs or touch the
+# network (lxml < 5 resolves external entities by default)
+if HAS_LXML:
+    XML_PARSER = ET.XMLParser(resolve_entities=False, no_network=True, load_dtd=False)
+else:
+    XML_PARSER = None
 
 # Force unbuffered output for real-time logging
 print = functools.partial(print, flush=True)
 
 
+# Runs of spaces/tabs inside text chunks collapse to a single space
+WHITESPACE_RE = re.compile(r'[ \t]+')
+
+# One scan over chapter XHTML finds every piece of markup: comments, CDATA,
+# doctype/processing instructions, whole script/style elements (their
+# bodies are never text) and ordinary start/end tags. Whatever lies between
+# matches is character data.
+TAG_ATTRS = r'''(?:[^>"']|"[^"]*"|'[^']*')*'''
+MARKUP_RE = re.compile(
+    r'<!--.*?-->'
+    r'|<!\[CDATA\[.*?\]\]>'
+    r'|<[!?][^>]*>'
+    r'|<(?P<raw>script|style)\b' + TAG_ATTRS + r'(?<!/)>.*?</(?P=raw)\s*>'
+    r'|<(?P<end>/)?(?P<tag>[a-zA-Z][^\t\n\r\f />\x00]*)(?P<attrs>' + TAG_ATTRS + r')>',
+    re.DOTALL | re.IGNORECASE)
+ATTR_RE = re.compile(r'''([^\s=/>]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+)))?''')
+
+# Text lines starting with these get a leading backslash so they are not
+# read back as .bookwash markers
+ESCAPE_PREFIXES = ('#', '\\#')
+
+# Extract chapter text in a process pool only for books at least this long;
+# below it, worker startup costs more than it saves
+PARALLEL_EXTRACT_MIN_CHAPTERS = 8
+# Chapters handed to a worker per round trip
+PARALLEL_EXTRACT_CHUNKSIZE = 4
+
+
 # --- HTML Text Extractor ---
 
-class HTMLTextExtractor(HTMLParser):
+class HTMLTextExtractor:
     """Extract text from HTML, preserving paragraph structure and basic formatting.
     
+    EPUB chapters are XHTML, so feed() tokenizes them with MARKUP_RE in one
+    regex pass instead of going through html.parser's Python state machine.
+    
     Preserves formatting using simple markers:
     - [H1]...[/H1], [H2]...[/H2], etc. for headings
     - [B]...[/B] for bold/strong
@@ -41,7 +87,6 @@ class HTMLTextExtractor(HTMLParser):
     """
     
     def __init__(self):
-        super().__init__()
         self.paragraphs = []
         self.current_text = []
         self.in_paragraph = False
@@ -67,6 +112,47 @@ class HTMLTextExtractor(HTMLParser):
         """Set the base directory for resolving relative image paths."""
         self.current_href_dir = href_dir
     
+    def feed(self, html_text: str):
+        """Tokenize a whole document and dispatch to the handle_* methods."""
+        pos = 0
+        for match in MARKUP_RE.finditer(html_text):
+            start = match.start()
+            if start > pos:
+                data = html_text[pos:start]
+                self.handle_data(html.unescape(data) if '&' in data else data)
+            pos = match.end()
+            
+            raw_tag = match.group('raw')
+            if raw_tag:
+                # script/style: open and close, skipping the body entirely
+                self.handle_starttag(raw_tag.lower(), [])
+                self.handle_endtag(raw_tag.lower())
+                continue
+            
+            tag = match.group('tag')
+            if tag is None:
+                # Comment, CDATA, doctype or processing instruction
+                continue
+            tag = tag.lower()
+            if match.group('end'):
+                self.handle_endtag(tag)
+                continue
+            
+            attrs_text = match.group('attrs')
+            # Only <img> attributes are ever read
+            attrs = []
+            if tag == 'img':
+                attrs = [(name.lower(), html.unescape(dq or sq or bare))
+                         for name, dq, sq, bare in ATTR_RE.findall(attrs_text)]
+            self.handle_starttag(tag, attrs)
+            if attrs_text.endswith('/'):
+                # Self-closing tag such as <br/>
+                self.handle_endtag(tag)
+        
+        if pos < len(html_text):
+            data = html_text[pos:]
+            self.handle_data(html.unescape(data) if '&' in data else data)
+    
     def handle_starttag(self, tag, attrs):
         tag = tag.lower()
         attrs_dict = dict(attrs)
@@ -175,9 +261,11 @@ class HTMLTextExtractor(HTMLParser):
             self.h1_text.append(data)
         
         if self.in_body:
-            # Normalize whitespace but preserve intentional line breaks
-            normalized = re.sub(r'[ \t]+', ' ', data)
-            self.current_text.append(normalized)
+            # Normalize whitespace but preserve intentional line breaks.
+            # Chunks with only single spaces are already normalized.
+            if '\t' in data or '  ' in data:
+                data = WHITESPACE_RE.sub(' ', data)
+            self.current_text.append(data)
     
     def get_result(self):
         # Flush any remaining text
@@ -188,6 +276,24 @@ class HTMLTextExtractor(HTMLParser):
         return self.paragraphs, self.title
 
 
+def extract_chapter_text(content: bytes) -> tuple:
+    """
+    Decode one chapter's XHTML and extract its text.
+    
+    Returns (paragraphs, title). Kept at module level so it can be
+    dispatched to worker processes.
+    """
+    # Try UTF-8, fall back to latin-1
+    try:
+        html_content = content.decode('utf-8')
+    except UnicodeDecodeError:
+        html_content = content.decode('latin-1')
+    
+    extractor = HTMLTextExtractor()
+    extractor.feed(html_content)
+    return extractor.get_result()
+
+
 # --- EPUB Parser ---
 
 class EPUBParser:
@@ -214,23 +320,27 @@ class EPUBParser:
         self.images = []  # list of {id, href, media-type}
         self.cover_image = None
     
-    def parse(self):
-        """Parse the EPUB file."""
+    def __enter__(self):
+        # The archive stays open for both parse() and extract_assets()
         self.zip_file = zipfile.ZipFile(self.epub_path, 'r')
-        
-        try:
-            self._find_opf()
-            self._parse_opf()
-            self._parse_toc()
-            self._extract_chapters()
-            self._find_images()
-        finally:
-            self.zip_file.close()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.zip_file.close()
+        self.zip_file = None
+    
+    def parse(self):
+        """Parse the EPUB file (call inside a ``with EPUBParser(...)`` block)."""
+        self._find_opf()
+        self._parse_opf()
+        self._parse_toc()
+        self._extract_chapters()
+        self._find_images()
     
     def _find_opf(self):
         """Find the OPF file path from container.xml."""
         container_xml = self.zip_file.read('META-INF/container.xml')
-        root = ET.fromstring(container_xml)
+        root = ET.fromstring(container_xml, XML_PARSER)
         
         rootfile = root.find('.//container:rootfile', self.NAMESPACES)
         if rootfile is None:
@@ -247,7 +357,7 @@ class EPUBParser:
     def _parse_opf(self):
         """Parse the OPF file for metadata, manifest, and spine."""
         opf_content = self.zip_file.read(self.opf_path)
-        root = ET.fromstring(opf_content)
+        root = ET.fromstring(opf_content, XML_PARSER)
         
         # Parse metadata
         metadata_elem = root.find('opf:metadata', self.NAMESPACES)
@@ -262,11 +372,14 @@ class EPUBParser:
         if manifest_elem is None:
             manifest_elem = root.find('{*}manifest')
         
+        cover_image_item = None  # first item with properties="cover-image"
         if manifest_elem is not None:
             for item in manifest_elem:
                 item_id = item.get('id')
                 href = item.get('href')
                 media_type = item.get('media-type')
+                if cover_image_item is None and 'cover-image' in (item.get('properties') or ''):
+                    cover_image_item = item
                 if item_id and href:
                     self.manifest[item_id] = {
                         'href': href,
@@ -285,7 +398,7 @@ class EPUBParser:
                     self.spine.append(idref)
         
         # Find cover image
-        self._find_cover(metadata_elem, root)
+        self._find_cover(metadata_elem, cover_image_item)
     
     def _parse_metadata(self, metadata_elem):
         """Extract metadata from OPF metadata element."""
@@ -312,8 +425,12 @@ class EPUBParser:
             'date': get_text('date'),
         }
     
-    def _find_cover(self, metadata_elem, root):
-        """Find cover image from various EPUB conventions."""
+    def _find_cover(self, metadata_elem, cover_image_item):
+        """Find cover image from various EPUB conventions.
+        
+        cover_image_item is the manifest item marked properties="cover-image",
+        noted while _parse_opf walked the manifest (None if there is none).
+        """
         cover_id = None
         
         # Method 1: meta name="cover" content="cover-id"
@@ -324,13 +441,8 @@ class EPUBParser:
                     break
         
         # Method 2: manifest item with properties="cover-image" (EPUB3)
-        if not cover_id:
-            manifest_elem = root.find('{*}manifest')
-            if manifest_elem is not None:
-                for item in manifest_elem:
-                    if 'cover-image' in (item.get('properties') or ''):
-                        cover_id = item.get('id')
-                        break
+        if not cover_id and cover_image_item is not None:
+            cover_id = cover_image_item.get('id')
         
         # Method 3: Look for common cover IDs
         if not cover_id:
@@ -364,7 +476,7 @@ class EPUBParser:
         if ncx_path:
             try:
                 ncx_content = self.zip_file.read(ncx_path)
-                root = ET.fromstring(ncx_content)
+                root = ET.fromstring(ncx_content, XML_PARSER)
                 self._parse_ncx(root)
             except Exception as e:
                 print(f"Warning: Could not parse NCX: {e}")
@@ -439,7 +551,8 @@ class EPUBParser:
 
     def _extract_chapters(self):
         """Extract chapter content from spine items."""
-        untitled_counter = 0
+        # Read chapters serially (the archive is shared), then extract them
+        pending = []  # (item_id, href, content bytes)
         
         for item_id in self.spine:
             if item_id not in self.manifest:
@@ -456,42 +569,45 @@ class EPUBParser:
             full_path = self.opf_dir + href
             
             try:
-                content = self.zip_file.read(full_path)
-                # Try UTF-8, fall back to latin-1
-                try:
-                    html_content = content.decode('utf-8')
-                except UnicodeDecodeError:
-                    html_content = content.decode('latin-1')
-                
-                # Extract text
-                extractor = HTMLTextExtractor()
-                extractor.feed(html_content)
-                paragraphs, title = extractor.get_result()
-                
-                # Use extracted title or fall back to item ID
-                chapter_title = title or item_id
-                
-                # Get section label from TOC, or synthesize one
-                href_filename = Path(href).name
-                if href_filename in self.toc_labels:
-                    section_label = self.toc_labels[href_filename]
-                elif title:
-                    # Use the H1 title if available
-                    section_label = title
-                else:
-                    # Synthesize a label for unlisted items
-                    untitled_counter += 1
-                    section_label = f"[Section {untitled_counter}]"
-                
-                self.chapters.append({
-                    'id': item_id,
-                    'href': href,
-                    'title': chapter_title,
-                    'section_label': section_label,
-                    'paragraphs': paragraphs,
-                })
+                pending.append((item_id, href, self.zip_file.read(full_path)))
             except Exception as e:
                 print(f"Warning: Could not extract chapter {item_id}: {e}")
+        
+        # Chapters extract independently, so spread them across CPU cores
+        # for long books. Results come back in spine order.
+        contents = [content for _, _, content in pending]
+        if len(pending) >= PARALLEL_EXTRACT_MIN_CHAPTERS and (os.cpu_count() or 1) > 1:
+            with ProcessPoolExecutor() as executor:
+                extracted = list(executor.map(extract_chapter_text, contents,
+                                              chunksize=PARALLEL_EXTRACT_CHUNKSIZE))
+        else:
+            extracted = [extract_chapter_text(content) for content in contents]
+        
+        untitled_counter = 0
+        
+        for (item_id, href, _), (paragraphs, title) in zip(pending, extracted):
+            # Use extracted title or fall back to item ID
+            chapter_title = title or item_id
+            
+            # Get section label from TOC, or synthesize one
+            href_filename = Path(href).name
+            if href_filename in self.toc_labels:
+                section_label = self.toc_labels[href_filename]
+            elif title:
+                # Use the H1 title if available
+                section_label = title
+            else:
+                # Synthesize a label for unlisted items
+                untitled_counter += 1
+                section_label = f"[Section {untitled_counter}]"
+            
+            self.chapters.append({
+                'id': item_id,
+                'href': href,
+                'title': chapter_title,
+                'section_label': section_label,
+                'paragraphs': paragraphs,
+            })
     
     def _find_images(self):
         """Find all images in the manifest."""
@@ -510,27 +626,24 @@ class EPUBParser:
         """Extract images and other assets to output directory."""
         output_dir.mkdir(parents=True, exist_ok=True)
         
-        self.zip_file = zipfile.ZipFile(self.epub_path, 'r')
+        extracted = []
         
-        try:
-            extracted = []
+        for image in self.images:
+            href = image['href']
+            full_path = self.opf_dir + href
+            filename = Path(href).name
             
-            for image in self.images:
-                href = image['href']
-                full_path = self.opf_dir + href
-                filename = Path(href).name
-                
-                try:
-                    data = self.zip_file.read(full_path)
+            try:
+                # Stream the member in 64 KiB chunks instead of holding it whole
+                with self.zip_file.open(full_path) as src:
                     output_path = output_dir / filename
-                    output_path.write_bytes(data)
-                    extracted.append(filename)
-                except Exception as e:
-                    print(f"Warning: Could not extract {href}: {e}")
-            
-            return extracted
-        finally:
-            self.zip_file.close()
+                    with open(output_path, 'wb') as dst:
+                        shutil.copyfileobj(src, dst, 1 << 16)
+                extracted.append(filename)
+            except Exception as e:
+                print(f"Warning: Could not extract {href}: {e}")
+        
+        return extracted
 
 
 # --- BookWash Writer ---
@@ -544,82 +657,79 @@ class BookWashWriter:
     
     def _escape_line(self, line: str) -> str:
         """Escape lines that start with # to avoid marker confusion."""
-        if line.startswith('#'):
-            return '\\' + line
-        if line.startswith('\\#'):
+        if line.startswith(ESCAPE_PREFIXES):
             return '\\' + line
         return line
     
     def _escape_text(self, text: str) -> str:
         """Escape text content, handling each line."""
-        lines = text.split('\n')
-        escaped_lines = [self._escape_line(line) for line in lines]
-        return '\n'.join(escaped_lines)
+        # Most paragraphs are a single line; skip the split/join for them
+        if '\n' not in text:
+            return self._escape_line(text)
+        return '\n'.join([self._escape_line(line) for line in text.split('\n')])
     
     def write(self, output_path: Path, assets_folder: str):
-        """Write the .bookwash file."""
-        lines = []
-        
-        # Header
-        lines.append('#BOOKWASH 1.0')
-        lines.append(f'#SOURCE: {self.source_filename}')
-        # Use Mountain Time for human-readable timestamp
-        mt = ZoneInfo('America/Denver')
-        now = datetime.now(mt)
-        timestamp = now.strftime('%m/%d/%y %I:%M%p MT').lower()[:-2] + 'MT'
-        lines.append(f'#CREATED: {timestamp}')
-        lines.append(f'#ASSETS: {assets_folder}')
-        
-        # Metadata
-        meta = self.parser.metadata
-        if meta.get('title'):
-            lines.append(f'#TITLE: {meta["title"]}')
-        if meta.get('author'):
-            lines.append(f'#AUTHOR: {meta["author"]}')
-        if meta.get('publisher'):
-            lines.append(f'#PUBLISHER: {meta["publisher"]}')
-        if meta.get('date'):
-            lines.append(f'#PUBLISHED: {meta["date"]}')
-        if meta.get('language'):
-            lines.append(f'#LANGUAGE: {meta["language"]}')
-        if meta.get('identifier'):
-            lines.append(f'#IDENTIFIER: {meta["identifier"]}')
-        if meta.get('description'):
-            # Description on single line, truncate if too long
-            desc = meta['description'].replace('\n', ' ').strip()
-            if len(desc) > 500:
-                desc = desc[:497] + '...'
-            lines.append(f'#DESCRIPTION: {desc}')
-        
-        lines.append('')  # Blank line after header
-        
-        # Cover image
-        if self.parser.cover_image:
-            cover_filename = Path(self.parser.cover_image['href']).name
-            lines.append(f'#IMAGE: {cover_filename}')
-            lines.append('')
-        
-        # Chapters
-        for i, chapter in enumerate(self.parser.chapters, 1):
-            # Use section_label from TOC (e.g., "Chapter 1", "Copyright", "Acknowledgments")
-            section_label = chapter.get('section_label', f'Section {i}')
-            lines.append(f'#SECTION: {section_label}')
+        """Write the .bookwash file, streaming lines through a buffered handle."""
+        # Each line after the first starts with its newline, matching the
+        # previous '\n'.join(lines) output (no trailing newline).
+        with open(output_path, 'w', encoding='utf-8', buffering=1 << 16) as f:
+            # Header
+            f.write('#BOOKWASH 1.0')
+            f.write(f'\n#SOURCE: {self.source_filename}')
+            # Use Mountain Time for human-readable timestamp
+            mt = ZoneInfo('America/Denver')
+            now = datetime.now(mt)
+            timestamp = now.strftime('%m/%d/%y %I:%M%p MT').lower()[:-2] + 'MT'
+            f.write(f'\n#CREATED: {timestamp}')
+            f.write(f'\n#ASSETS: {assets_folder}')
+            
+            # Metadata
+            meta = self.parser.metadata
+            if meta.get('title'):
+                f.write(f'\n#TITLE: {meta["title"]}')
+            if meta.get('author'):
+                f.write(f'\n#AUTHOR: {meta["author"]}')
+            if meta.get('publisher'):
+                f.write(f'\n#PUBLISHER: {meta["publisher"]}')
+            if meta.get('date'):
+                f.write(f'\n#PUBLISHED: {meta["date"]}')
+            if meta.get('language'):
+                f.write(f'\n#LANGUAGE: {meta["language"]}')
+            if meta.get('identifier'):
+                f.write(f'\n#IDENTIFIER: {meta["identifier"]}')
+            if meta.get('description'):
+                # Description on single line, truncate if too long
+                desc = meta['description'].replace('\n', ' ').strip()
+                if len(desc) > 500:
+                    desc = desc[:497] + '...'
+                f.write(f'\n#DESCRIPTION: {desc}')
             
-            # Add title if it's different from section label (and meaningful)
-            title = chapter['title']
-            if title and title != chapter['id'] and title != section_label:
-                lines.append(f'#TITLE: {title}')
+            f.write('\n')  # Blank line after header
             
-            lines.append('')  # Blank line after chapter header
+            # Cover image
+            if self.parser.cover_image:
+                cover_filename = Path(self.parser.cover_image['href']).name
+                f.write(f'\n#IMAGE: {cover_filename}')
+                f.write('\n')
             
-            # Paragraphs
-            for para in chapter['paragraphs']:
-                escaped = self._escape_text(para)
-                lines.append(escaped)
-                lines.append('')  # Blank line between paragraphs
-        
-        # Write file
-        output_path.write_text('\n'.join(lines), encoding='utf-8')
+            # Chapters
+            for i, chapter in enumerate(self.parser.chapters, 1):
+                # Use section_label from TOC (e.g., "Chapter 1", "Copyright", "Acknowledgments")
+                section_label = chapter.get('section_label', f'Section {i}')
+                f.write(f'\n#SECTION: {section_label}')
+                
+                # Add title if it's different from section label (and meaningful)
+                title = chapter['title']
+                if title and title != chapter['id'] and title != section_label:
+                    f.write(f'\n#TITLE: {title}')
+                
+                f.write('\n')  # Blank line after chapter header
+                
+                # Paragraphs, each followed by a blank line
+                for para in chapter['paragraphs']:
+                    f.write('\n')
+                    f.write(self._escape_text(para))
+                    f.write('\n')
 
 
 # --- Main ---
@@ -666,19 +776,19 @@ Examples:
     
     # Parse EPUB
     print(f"Parsing EPUB: {input_path.name}")
-    epub = EPUBParser(str(input_path))
-    epub.parse()
-    
-    if args.verbose:
-        print(f"  Title:    {epub.metadata.get('title', 'Unknown')}")
-        print(f"  Author:   {epub.metadata.get('author', 'Unknown')}")
-        print(f"  Chapters: {len(epub.chapters)}")
-        print(f"  Images:   {len(epub.images)}")
-        print()
-    
-    # Extract assets
-    print(f"Extracting assets to: {assets_folder}/")
-    extracted = epub.extract_assets(assets_path)
+    with EPUBParser(str(input_path)) as epub:
+        epub.parse()
+        
+        if args.verbose:
+            print(f"  Title:    {epub.metadata.get('title', 'Unknown')}")
+            print(f"  Author:   {epub.metadata.get('author', 'Unknown')}")
+            print(f"  Chapters: {len(epub.chapters)}")
+            print(f"  Images:   {len(epub.images)}")
+            print()
+        
+        # Extract assets
+        print(f"Extracting assets to: {assets_folder}/")
+        extracted = epub.extract_assets(assets_path)
     
     if args.verbose:
         for filename in extracted:
@@ -10,7 +10,7 @@ legitimate non-profane meanings that require context to evaluate.
 """
 
 import re
-from typing import Tuple, List
+from typing import Callable, Tuple, List
 
 # =============================================================================
 # PHRASE REPLACEMENTS (applied first - longer matches before shorter)
@@ -204,26 +204,33 @@ WORD_REPLACEMENTS: List[Tuple[str, str]] = [
 ]
 
 
-def _preserve_case(original: str, replacement: str) -> str:
+def _case_replacer(replacement: str) -> Callable[[re.Match], str]:
     """
-    Apply the case pattern from original to replacement.
-    
-    Examples:
-        _preserve_case("SHIT", "crud") -> "CRUD"
-        _preserve_case("Shit", "crud") -> "Crud"
-        _preserve_case("shit", "crud") -> "crud"
-        _preserve_case("What the hell", "what on earth") -> "What on earth"
+    Build a re.sub callback that applies the matched text's case pattern to
+    replacement. The three case variants are computed once, not per match.
+    
+    Examples (replacement "crud", or "what on earth"):
+        "SHIT" -> "CRUD"
+        "Shit" -> "Crud"
+        "shit" -> "crud"
+        "What the hell" -> "What on earth"
     """
-    if original.isupper():
-        return replacement.upper()
-    elif original.islower():
-        return replacement.lower()
-    elif len(original) > 0 and original[0].isupper():
-        # First letter is uppercase - capitalize first letter of replacement
-        return replacement[0].upper() + replacement[1:] if replacement else replacement
-    else:
-        # Default to lowercase
-        return replacement.lower()
+    upper = replacement.upper()
+    lower = replacement.lower()
+    # First letter is uppercase - capitalize first letter of replacement
+    title = replacement[0].upper() + replacement[1:] if replacement else replacement
+    
+    def replacer(match: re.Match) -> str:
+        original = match.group(0)
+        if original.isupper():
+            return upper
+        # All-lowercase text never starts with an uppercase letter, so this
+        # only catches mixed case; everything else defaults to lowercase
+        if original[0].isupper():
+            return title
+        return lower
+    
+    return replacer
 
 
 def _create_word_pattern(word: str) -> re.Pattern:
@@ -240,6 +247,34 @@ def _create_phrase_pattern(phrase: str) -> re.Pattern:
     return re.compile(escaped, re.IGNORECASE)
 
 
+# Compiled once at import: phrases longest first, then words. Each entry is
+# (lowercase needle, pattern, re.sub callback writing the case-matched
+# replacement); the needle lets a plain substring test skip the regex.
+PHRASE_PATTERNS: List[Tuple[str, re.Pattern, Callable[[re.Match], str]]] = [
+    (phrase.lower(), _create_phrase_pattern(phrase), _case_replacer(replacement))
+    for phrase, replacement in sorted(PHRASE_REPLACEMENTS, key=lambda x: len(x[0]), reverse=True)
+]
+WORD_PATTERNS: List[Tuple[str, re.Pattern, Callable[[re.Match], str]]] = [
+    (word.lower(), _create_word_pattern(word), _case_replacer(replacement))
+    for word, replacement in WORD_REPLACEMENTS
+]
+
+# Characters an IGNORECASE pattern matches to "i"/"s" whose lower() is not
+# exactly that letter (dotted/dotless I, long s)
+FOLD_TABLE = str.maketrans({'\u0130': 'i', '\u0131': 'i', '\u017f': 's'})
+
+
+def _fold_case(text: str) -> str:
+    """
+    Lowercase text so that `needle in _fold_case(text)` holds wherever a
+    pattern's IGNORECASE regex could match; the check can give false
+    positives but never false negatives.
+    """
+    if text.isascii():
+        return text.lower()
+    return text.translate(FOLD_TABLE).lower()
+
+
 def prefilter_language(text: str) -> str:
     """
     Apply regex replacements for unambiguous profanity before LLM processing.
@@ -256,26 +291,23 @@ def prefilter_language(text: str) -> str:
         Text with unambiguous profanity replaced
     """
     result = text
+    folded = _fold_case(result)
     
     # Phase 1: Replace phrases (sorted by length, longest first)
-    sorted_phrases = sorted(PHRASE_REPLACEMENTS, key=lambda x: len(x[0]), reverse=True)
-    
-    for phrase, replacement in sorted_phrases:
-        pattern = _create_phrase_pattern(phrase)
-        
-        def phrase_replacer(match: re.Match) -> str:
-            return _preserve_case(match.group(0), replacement)
-        
-        result = pattern.sub(phrase_replacer, result)
+    for needle, pattern, replacer in PHRASE_PATTERNS:
+        if needle not in folded:
+            continue
+        result, n = pattern.subn(replacer, result)
+        if n:
+            folded = _fold_case(result)
     
     # Phase 2: Replace single words
-    for word, replacement in WORD_REPLACEMENTS:
-        pattern = _create_word_pattern(word)
-        
-        def word_replacer(match: re.Match) -> str:
-            return _preserve_case(match.group(0), replacement)
-        
-        result = pattern.sub(word_replacer, result)
+    for needle, pattern, replacer in WORD_PATTERNS:
+        if needle not in folded:
+            continue
+        result, n = pattern.subn(replacer, result)
+        if n:
+            folded = _fold_case(result)
     
     return result
 
@@ -288,19 +320,22 @@ def get_replacement_count(text: str) -> int:
     count = 0
     
     # Count phrase matches
-    sorted_phrases = sorted(PHRASE_REPLACEMENTS, key=lambda x: len(x[0]), reverse=True)
     temp_text = text
+    folded = _fold_case(temp_text)
     
-    for phrase, _ in sorted_phrases:
-        pattern = _create_phrase_pattern(phrase)
-        matches = pattern.findall(temp_text)
-        count += len(matches)
+    for needle, pattern, _ in PHRASE_PATTERNS:
+        if needle not in folded:
+            continue
         # Remove matches so we don't double-count overlaps
-        temp_text = pattern.sub("", temp_text)
+        temp_text, n = pattern.subn("", temp_text)
+        if n:
+            count += n
+            folded = _fold_case(temp_text)
     
     # Count word matches
-    for word, _ in WORD_REPLACEMENTS:
-        pattern = _create_word_pattern(word)
+    for needle, pattern, _ in WORD_PATTERNS:
+        if needle not in folded:
+            continue
         matches = pattern.findall(temp_text)
         count += len(matches)
     
@@ -23,13 +23,19 @@ Environment:
 """
 
 import argparse
+import contextlib
+import hashlib
+import json
 import os
 import sys
 import time
 import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 from pathlib import Path
 from datetime import datetime
 
@@ -45,6 +51,27 @@ try:
 except ImportError:
     import bookwash_llm
 
+# google-generativeai is only needed by rate_text; pipeline tests call the
+# API through bookwash_llm
+try:
+    import google.generativeai as genai
+    HAS_GENAI = True
+except ImportError:
+    HAS_GENAI = False
+genai_configured = False  # genai.configure() runs once per process
+genai_configure_lock = threading.Lock()
+
+# Ratings already fetched, keyed by sha256 of model + prompt, so re-running
+# the fixed suites costs no API calls
+LLM_CACHE_PATH = Path(__file__).resolve().parent.parent / 'data' / 'llm_cache.json'
+llm_cache = None  # Loaded from LLM_CACHE_PATH on first use
+llm_cache_lock = threading.Lock()  # Guards llm_cache across rating workers
+
+NUM_WORKERS = 5  # Parallel rating calls in run_test_suite
+RATING_RPM = 60  # Most rating API calls allowed in any 60-second window
+
+JSON_DECODER = json.JSONDecoder()  # Parses the rating object out of model replies
+
 
 class Rating(Enum):
     G = 1
@@ -54,21 +81,26 @@ class Rating(Enum):
     X = 5
 
 
+# Rating strings as normalized by parse_rating (upper case, hyphens removed)
+RATING_NAMES = {
+    'G': Rating.G,
+    'PG': Rating.PG,
+    'PG13': Rating.PG13,
+    'PG 13': Rating.PG13,
+    'R': Rating.R,
+    'X': Rating.X,
+    'UNRATED': Rating.X,
+    'NC17': Rating.X,
+}
+
+
 def parse_rating(s: str) -> Rating:
     """Parse rating string to enum."""
     s = s.upper().strip().replace('-', '')
-    if s == 'G':
-        return Rating.G
-    elif s == 'PG':
-        return Rating.PG
-    elif s in ('PG13', 'PG 13'):
-        return Rating.PG13
-    elif s == 'R':
-        return Rating.R
-    elif s in ('X', 'UNRATED', 'NC17', 'NC-17'):
-        return Rating.X
-    else:
+    rating = RATING_NAMES.get(s)
+    if rating is None:
         raise ValueError(f"Unknown rating: {s}")
+    return rating
 
 
 def rating_to_str(r: Rating) -> str:
@@ -83,7 +115,11 @@ def rating_to_level(r: Rating) -> int:
     return r.value
 
 
-@dataclass
+# Same slotted-dataclass pattern as bookwash_to_epub.py (slots need Python 3.10+)
+DATACLASS_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(frozen=True, **DATACLASS_SLOTS)
 class TestParagraph:
     """A test paragraph with expected ratings."""
     text: str
@@ -108,7 +144,7 @@ class TestResult:
     error: Optional[str] = None
 
 
-@dataclass
+@dataclass(**DATACLASS_SLOTS)
 class ConfusionMatrix:
     """Track rating prediction accuracy."""
     true_positives: int = 0   # Correctly identified content that should be filtered
@@ -146,16 +182,19 @@ class ConfusionMatrix:
         return self.true_positives / denom if denom > 0 else 0.0
     
     def print_summary(self, name: str):
+        # Read each metric property once
+        accuracy, precision, recall = self.accuracy, self.precision, self.recall
+        
         print(f"\n[{name} Filter]")
         print(f"  TP: {self.true_positives}  FP: {self.false_positives}")
         print(f"  FN: {self.false_negatives}  TN: {self.true_negatives}")
-        print(f"  Accuracy: {self.accuracy * 100:.1f}%")
+        print(f"  Accuracy: {accuracy * 100:.1f}%")
         if self.true_positives + self.false_negatives == 0:
             print("  Precision: N/A (no positive cases)")
             print("  Recall: N/A (no positive cases)")
         else:
-            print(f"  Precision: {self.precision * 100:.1f}%")
-            print(f"  Recall: {self.recall * 100:.1f}%")
+            print(f"  Precision: {precision * 100:.1f}%")
+            print(f"  Recall: {recall * 100:.1f}%")
 
 
 def build_test_suite() -> List[TestParagraph]:
@@ -490,18 +529,8 @@ def build_holdout_suite() -> List[TestParagraph]:
     ]
 
 
-def rate_text(text: str, model: str = "gemini-1.5-flash") -> dict:
-    """Rate text using bookwash_llm.py logic."""
-    import google.generativeai as genai
-    
-    api_key = os.environ.get('GEMINI_API_KEY', '')
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY environment variable not set")
-    
-    genai.configure(api_key=api_key)
-    
-    # Use the same rating prompt from bookwash_llm.py with proper definitions
-    rating_prompt = f'''You are a content rating assistant. Rate the following text for:
+# The rating rubric; only the text to rate varies between prompts
+RATING_PROMPT_PREFIX = '''You are a content rating assistant. Rate the following text for:
 1. Language/Profanity (G, PG, PG-13, R, X)
 2. Adult/Sexual Content (G, PG, PG-13, R, X)  
 3. Violence (G, PG, PG-13, R, X)
@@ -537,29 +566,163 @@ Be vigilant for SUBTLE adult content:
 - Implied/off-screen activity (morning-after scenes, disheveled appearance)
 
 Respond with ONLY a JSON object in this format:
-{{"language": "X", "adult": "X", "violence": "X"}}
+{"language": "X", "adult": "X", "violence": "X"}
 
 Text to rate:
-{text}'''
+'''
 
-    model_instance = genai.GenerativeModel(model)
-    response = model_instance.generate_content(rating_prompt)
+
+def build_rating_prompt(text: str) -> str:
+    """Build the rating prompt for text."""
+    # Use the same rating prompt from bookwash_llm.py with proper definitions
+    return RATING_PROMPT_PREFIX + text
+
+
+def configure_genai():
+    """Configure the Gemini SDK with GEMINI_API_KEY, once for all threads."""
+    global genai_configured
+    if genai_configured:
+        return
+    
+    with genai_configure_lock:
+        if genai_configured:
+            return
+        
+        api_key = os.environ.get('GEMINI_API_KEY', '')
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY environment variable not set")
+        
+        genai.configure(api_key=api_key)
+        genai_configured = True
+
+
+@functools.lru_cache(maxsize=8)
+def get_generative_model(model_name: str):
+    """Return one shared GenerativeModel per model name."""
+    return genai.GenerativeModel(model_name)
+
+
+def rate_text(text: str, model: str = "gemini-1.5-flash") -> dict:
+    """Rate text using bookwash_llm.py logic."""
+    if not HAS_GENAI:
+        raise ImportError("google-generativeai is not installed (pip install google-generativeai)")
     
-    import json
-    import re
+    configure_genai()
+    
+    rating_prompt = build_rating_prompt(text)
+    model_instance = get_generative_model(model)
+    rate_limiter.acquire()
+    response = model_instance.generate_content(rating_prompt)
     
     # Extract JSON from response
     response_text = response.text.strip()
-    # Try to find JSON in the response
-    json_match = re.search(r'\{[^}]+\}', response_text)
-    if json_match:
-        return json.loads(json_match.group())
-    else:
+    # Decode the object starting at the first brace in place (handles any
+    # surrounding prose or code fences, and nested braces)
+    json_start = response_text.find('{')
+    if json_start < 0:
         raise ValueError(f"Could not parse rating response: {response_text}")
+    ratings, _ = JSON_DECODER.raw_decode(response_text, json_start)
+    return ratings
+
+
+class RateLimiter:
+    """Sliding-window limit of `rpm` calls per minute, shared by all threads.
+    
+    acquire() only blocks once `rpm` calls have started within the last
+    60 seconds, so short runs go at full speed.
+    """
+    
+    def __init__(self, rpm: int):
+        self.rpm = rpm
+        self.call_times = deque()  # Start times of the last `rpm` calls
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            if len(self.call_times) >= self.rpm:
+                wait = self.call_times[0] + 60.0 - now
+                if wait > 0:
+                    time.sleep(wait)
+                    now = time.monotonic()
+                self.call_times.popleft()
+            self.call_times.append(now)
+
+
+rate_limiter = RateLimiter(RATING_RPM)  # Cached ratings never reach it
 
 
-def run_test_suite(paragraphs: List[TestParagraph], rate_only: bool = False, model: str = "gemini-1.5-flash"):
-    """Run test suite and compute confusion matrices."""
+def load_llm_cache() -> Dict[str, dict]:
+    """Load the on-disk rating cache (empty if missing or unreadable)."""
+    global llm_cache
+    if llm_cache is None:
+        try:
+            llm_cache = json.loads(LLM_CACHE_PATH.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            llm_cache = {}
+        except (OSError, ValueError) as e:
+            print(f"Warning: Ignoring unreadable LLM cache {LLM_CACHE_PATH}: {e}")
+            llm_cache = {}
+    return llm_cache
+
+
+def save_llm_cache():
+    """Write the rating cache back to disk."""
+    LLM_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    # Write then rename so an interrupted run never leaves a truncated cache
+    tmp_path = LLM_CACHE_PATH.with_suffix('.tmp')
+    tmp_path.write_text(json.dumps(llm_cache), encoding='utf-8')
+    os.replace(tmp_path, LLM_CACHE_PATH)
+
+
+def rate_text_cached(text: str, model: str = "gemini-1.5-flash", use_cache: bool = True) -> Tuple[dict, bool]:
+    """
+    Rate text, reusing a stored rating for the same model and prompt.
+    
+    Returns (ratings, from_cache).
+    """
+    if not use_cache:
+        return rate_text(text, model=model), False
+    
+    key = hashlib.sha256(f"{model}\0{build_rating_prompt(text)}".encode('utf-8')).hexdigest()
+    with llm_cache_lock:
+        cache = load_llm_cache()
+        if key in cache:
+            return cache[key], True
+    
+    ratings = rate_text(text, model=model)
+    with llm_cache_lock:
+        cache[key] = ratings
+        save_llm_cache()
+    return ratings, False
+
+
+def load_results_file(results_path: Path) -> Dict[str, dict]:
+    """Read successful results from a results JSONL file, keyed by label."""
+    previous = {}
+    if not results_path.exists():
+        return previous
+    
+    with open(results_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Line cut short by an interrupted run
+            # Errored paragraphs are rated again
+            if record.get('actual') and not record.get('error'):
+                previous[record['label']] = record
+    return previous
+
+
+def run_test_suite(paragraphs: List[TestParagraph], rate_only: bool = False, model: str = "gemini-1.5-flash",
+                   use_cache: bool = True, results_path: Optional[Path] = None, resume: bool = False):
+    """Run test suite and compute confusion matrices.
+    
+    With results_path, each paragraph's result is appended to that JSONL
+    file as soon as it is known; with resume, paragraphs already rated
+    there are counted from the file instead of being rated again.
+    """
     
     # Separate matrices for each category
     matrices = {
@@ -575,57 +738,94 @@ def run_test_suite(paragraphs: List[TestParagraph], rate_only: bool = False, mod
     print(f"Running {'rate-only' if rate_only else 'full'} test suite with model: {model}")
     print(f"{'='*60}\n")
     
-    for i, para in enumerate(paragraphs, 1):
-        print(f"[{i}/{len(paragraphs)}] {para.label}")
-        print(f"  Expected: {para.category}={rating_to_str(para.expected_rating)}")
+    previous = load_results_file(results_path) if results_path and resume else {}
+    results_file = open(results_path, 'a' if resume else 'w', encoding='utf-8') if results_path else contextlib.nullcontext()
+    if results_path and resume and results_file.tell() > 0:
+        with open(results_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                # Finish a line cut short by an interrupted run
+                results_file.write('\n')
+    
+    # Rate all paragraphs in parallel (rate_limiter keeps API calls under
+    # the RPM cap); results are reported and recorded in suite order
+    with results_file, ThreadPoolExecutor(max_workers=NUM_WORKERS) as executor:
+        # One call per distinct text; duplicate paragraphs share its future
+        futures_by_text = {}
+        futures = []
+        for para in paragraphs:
+            if para.label in previous:
+                futures.append(None)
+                continue
+            if para.text not in futures_by_text:
+                futures_by_text[para.text] = executor.submit(rate_text_cached, para.text, model, use_cache)
+            futures.append(futures_by_text[para.text])
         
-        try:
-            ratings = rate_text(para.text, model=model)
-            
-            # Map category name to response key
-            category_key = para.category
-            if category_key == 'adult':
-                category_key = 'adult'
-            
-            actual_str = ratings.get(category_key, 'G')
-            actual = parse_rating(actual_str)
-            
-            print(f"  Actual:   {category_key}={rating_to_str(actual)}")
+        for i, (para, future) in enumerate(zip(paragraphs, futures), 1):
+            print(f"[{i}/{len(paragraphs)}] {para.label}")
+            print(f"  Expected: {para.category}={rating_to_str(para.expected_rating)}")
             
-            # For confusion matrix: "needs filter" means rating > G for the category
-            # We test at PG level (filter anything > G)
-            expected_needs_filter = para.expected_rating.value > Rating.G.value
-            actual_needs_filter = actual.value > Rating.G.value
-            
-            matrices[para.category].record(expected_needs_filter, actual_needs_filter)
-            
-            # Check if rating matches expected
-            match = actual == para.expected_rating
-            status = "✅" if match else "❌"
-            print(f"  Result:   {status} {'Match' if match else f'Expected {rating_to_str(para.expected_rating)}, got {rating_to_str(actual)}'}")
-            
-            results.append({
-                'label': para.label,
-                'expected': para.expected_rating,
-                'actual': actual,
-                'match': match,
-            })
+            record = None  # Line for the results file
+            try:
+                # Map category name to response key
+                category_key = para.category
+                if category_key == 'adult':
+                    category_key = 'adult'
+                
+                from_cache = False
+                if future is None:
+                    # Rated by an earlier run
+                    actual = parse_rating(previous[para.label]['actual'])
+                else:
+                    ratings, from_cache = future.result()
+                    actual_str = ratings.get(category_key, 'G')
+                    actual = parse_rating(actual_str)
+                
+                print(f"  Actual:   {category_key}={rating_to_str(actual)}{' (cached)' if from_cache else ''}")
+                
+                # For confusion matrix: "needs filter" means rating > G for the category
+                # We test at PG level (filter anything > G)
+                expected_needs_filter = para.expected_rating.value > Rating.G.value
+                actual_needs_filter = actual.value > Rating.G.value
+                
+                matrices[para.category].record(expected_needs_filter, actual_needs_filter)
+                
+                # Check if rating matches expected
+                match = actual == para.expected_rating
+                status = "✅" if match else "❌"
+                print(f"  Result:   {status} {'Match' if match else f'Expected {rating_to_str(para.expected_rating)}, got {rating_to_str(actual)}'}")
+                
+                results.append({
+                    'label': para.label,
+                    'expected': para.expected_rating,
+                    'actual': actual,
+                    'match': match,
+                })
+                if future is not None:
+                    record = {'label': para.label, 'category': para.category,
+                              'expected': rating_to_str(para.expected_rating),
+                              'actual': rating_to_str(actual), 'match': match}
+                
+            except Exception as e:
+                print(f"  Error: {e}")
+                results.append({
+                    'label': para.label,
+                    'expected': para.expected_rating,
+                    'actual': None,
+                    'match': False,
+                    'error': str(e),
+                })
+                record = {'label': para.label, 'category': para.category,
+                          'expected': rating_to_str(para.expected_rating),
+                          'actual': None, 'match': False, 'error': str(e)}
             
-            # Rate limit pause
-            time.sleep(1.0)
+            if results_path and record is not None:
+                # Flush per line so an interrupted run can be resumed
+                results_file.write(json.dumps(record) + '\n')
+                results_file.flush()
             
-        except Exception as e:
-            print(f"  Error: {e}")
-            results.append({
-                'label': para.label,
-                'expected': para.expected_rating,
-                'actual': None,
-                'match': False,
-                'error': str(e),
-            })
+            print()
         
-        print()
-    
     # Print confusion matrices
     print("\n" + "="*60)
     print("CONFUSION MATRIX SUMMARY (filter threshold: > G)")
@@ -1078,8 +1278,14 @@ def main():
     parser.add_argument('--expected-language', default='G', help='Expected language rating')
     parser.add_argument('--expected-adult', default='G', help='Expected adult rating')
     parser.add_argument('--expected-violence', default='G', help='Expected violence rating')
+    parser.add_argument('--no-cache', action='store_true', help='Always call the API instead of reusing cached ratings')
+    parser.add_argument('--results-file', type=str, default=None, help='Append each test-suite/holdout result to this JSONL file as it completes')
+    parser.add_argument('--resume', action='store_true', help='Skip paragraphs already rated in --results-file')
     
     args = parser.parse_args()
+    if args.resume and not args.results_file:
+        parser.error('--resume requires --results-file')
+    results_path = Path(args.results_file) if args.results_file else None
     
     if args.text:
         # Test custom text
@@ -1088,8 +1294,8 @@ def main():
         print()
         
         try:
-            ratings = rate_text(args.text, model=args.model)
-            print(f"Results:")
+            ratings, from_cache = rate_text_cached(args.text, model=args.model, use_cache=not args.no_cache)
+            print(f"Results{' (cached, rerun with --no-cache for a fresh rating)' if from_cache else ''}:")
             print(f"  Language: {ratings.get('language', 'N/A')}")
             print(f"  Adult: {ratings.get('adult', 'N/A')}")
             print(f"  Violence: {ratings.get('violence', 'N/A')}")
@@ -1118,11 +1324,13 @@ def main():
             
     elif args.test_suite:
         paragraphs = build_test_suite()
-        run_test_suite(paragraphs, rate_only=args.rate_only, model=args.model)
+        run_test_suite(paragraphs, rate_only=args.rate_only, model=args.model, use_cache=not args.no_cache,
+                       results_path=results_path, resume=args.resume)
         
     elif args.holdout:
         paragraphs = build_holdout_suite()
-        run_test_suite(paragraphs, rate_only=args.rate_only, model=args.model)
+        run_test_suite(paragraphs, rate_only=args.rate_only, model=args.model, use_cache=not args.no_cache,
+                       results_path=results_path, resume=args.resume)
         
     else:
         parser.print_help()